@@ -1,147 +1,253 @@
 # set up
 import dash
 from dash import dcc, html, dash_table
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
+import os
+import uuid
 import requests
 import pandas as pd
 import datetime
 import numpy as np
 
-import plotly.graph_objects as go
-import plotly.figure_factory as ff
-from plotly.subplots import make_subplots
-
 from tm_stats.elo import (
+    add_corporation_origin,
+    compute_historical_ratings,
     compute_historical_player_ratings,
     compute_historical_corp_ratings,
+    bootstrap_current_ratings,
+    current_ratings,
     make_plotly_player_ts_ratings_plot,
     make_plotly_corp_ts_ratings_plot,
+    make_plotly_current_ratings_plot,
+    config_key,
 )
+from tm_stats.aggregates import build_aggregates, game_summary
+from tm_stats.cache import LRUCache
+from tm_stats.db import GameDatabase
+from tm_stats.h2h import build_head_to_head, head_to_head, refresh_head_to_head
+from tm_stats.histograms import make_plotly_card_points_plot
+from tm_stats.jobs import JobQueue, stage_progress
+from tm_stats.remote import DATA_URL, DatasetMirror
+from tm_stats.row_index import sort_by_game
+from tm_stats.state import DatasetState, StateStore
+from tm_stats.table_query import filter_positions, page, sort_positions
+
+# Elo histories only depend on the data, game type and scoring function, so dropdowns that
+# just change what is displayed (players, expansions) are served from this cache
+elo_cache = LRUCache(max_entries=int(os.environ.get("ELO_CACHE_MAX_ENTRIES", 16)))
+
+# built "Points from Cards" figures per dataset version, player and density option
+player_points_on_card_cache = LRUCache(max_entries=64)
+
+
+def warm_elo_cache(df, data_version):
+    """
+    Fill the Elo cache with every dashboard variant, using one batched pass over the games
+    per entity type instead of one pass per variant.
+    """
+    player_configs = [
+        {"score_fun": score_fun, "subset": subset}
+        for score_fun in ["linear", "exp"]
+        for subset in ["all", "two-player", "non-two-player"]
+    ]
+    corp_configs = [{"score_fun": score_fun} for score_fun in ["linear", "exp"]]
+
+    player_ratings_df = compute_historical_ratings(df, "player", player_configs)
+    for config in player_configs:
+        elo_cache.set(
+            (data_version, "player", config["subset"], config["score_fun"]),
+            player_ratings_df[player_ratings_df.config == config_key(config)]
+            .drop(columns="config")
+            .reset_index(drop=True),
+        )
+
+    corp_ratings_df = add_corporation_origin(
+        compute_historical_ratings(df, "corporation", corp_configs), df
+    )
+    for config in corp_configs:
+        elo_cache.set(
+            (data_version, "corporation", "all", config["score_fun"]),
+            corp_ratings_df[corp_ratings_df.config == config_key(config)]
+            .drop(columns="config")
+            .reset_index(drop=True),
+        )
+
+
+def build_state(df, version, data_version, previous=None):
+    """
+    Everything the callbacks read for one dataset version. Runs before the version is
+    published, so the first request against it finds warm caches. Indexes of the previous
+    version are extended rather than rebuilt when the new version only adds games.
+    """
+    # each game's rows contiguous, so the aggregates can take games as slices
+    df = sort_by_game(
+        df.assign(
+            corporation_origin=df["corporation_origin"].str.strip().astype("category")
+        )
+    )
+    warm_elo_cache(df, data_version)
+    state = DatasetState(
+        version,
+        data_version,
+        df,
+        most_recent_game_date=df.date.max().strftime("%Y-%m-%d"),
+        # win rates, per-game summaries, card point histograms, ...
+        **build_aggregates(df),
+        # pairwise records for the head-to-head tab
+        h2h_indexes={
+            entity_col: (
+                build_head_to_head(df, entity_col)
+                if previous is None
+                else refresh_head_to_head(
+                    previous.h2h_indexes[entity_col], previous.df, df
+                )
+            )
+            for entity_col in ["player", "corporation"]
+        },
+    )
+    for player in state.players:
+        player_points_on_card_cache.set(
+            (data_version, player, False),
+            make_plotly_card_points_plot(state.card_point_histograms, player),
+        )
+    return state
+
+
+# data: read from local disk at boot (the last download, else the typed
+# terraforming-mars-stats.parquet or CSV deployed with the app), then kept fresh from
+# upstream in the background. A new version is built on the refresh thread and swapped
+# in whole; callbacks read states.current once and use that snapshot throughout.
+data_mirror = DatasetMirror(url=os.environ.get("TM_STATS_DATA_URL", DATA_URL))
+states = StateStore(build_state)
+states.publish(data_mirror.load())
+data_refresh_seconds = float(os.environ.get("TM_STATS_REFRESH_SECONDS", 600))
+if data_refresh_seconds > 0:
+    data_mirror.start(
+        interval=data_refresh_seconds,
+        on_change=lambda: states.publish(data_mirror.load()),
+    )
+
 
-# data
-df = pd.read_csv(
-    "https://raw.githubusercontent.com/AnthonyRentsch/terraforming-mars-stats/main/terraforming-mars-stats.csv"
+# indexed per-player, per-game and raw table queries from the SQLite copy written by
+# python -m tm_stats.etl --sqlite, when TM_STATS_DB points at one; every worker reads the
+# same file instead of filtering its own copy of the data
+games_db = (
+    GameDatabase(os.environ["TM_STATS_DB"]) if os.environ.get("TM_STATS_DB") else None
 )
-df["corporation_origin"] = df["corporation_origin"].str.strip()
 
-# pre-computed fields
-most_recent_game_date = max(df.date)
-most_recent_game_df = df[df.date == max(df.date)]
+
+def get_games_df(state, num_player_category):
+    df = state.df
+    if num_player_category == "two-player":
+        return df[df.num_players == 2]
+    elif num_player_category == "non-two-player":
+        return df[df.num_players != 2]
+    return df
+
+
+# progress, when given, is called while ratings are computed on a cache miss and may
+# raise JobCancelled, which stops the computation without caching anything
+def get_player_ratings(state, num_player_category, score_fun, progress=None):
+    return elo_cache.get_or_compute(
+        (state.data_version, "player", num_player_category, score_fun),
+        lambda: compute_historical_player_ratings(
+            df=get_games_df(state, num_player_category),
+            score_fun=score_fun,
+            progress=progress,
+        ),
+    )
+
+
+def get_corp_ratings(state, score_fun, progress=None):
+    return elo_cache.get_or_compute(
+        (state.data_version, "corporation", "all", score_fun),
+        lambda: compute_historical_corp_ratings(
+            df=state.df, score_fun=score_fun, progress=progress
+        ),
+    )
+
+
+def get_rating_intervals(
+    state, entity_col, num_player_category, score_fun, progress=None
+):
+    return elo_cache.get_or_compute(
+        (state.data_version, f"{entity_col}-intervals", num_player_category, score_fun),
+        lambda: bootstrap_current_ratings(
+            get_games_df(state, num_player_category),
+            entity_col=entity_col,
+            score_fun=score_fun,
+            B=1000,
+            progress=progress,
+        ),
+    )
+
+
+def add_rating_intervals(ratings_df, ci_df, entity_col):
+    ratings_df = ratings_df.merge(
+        ci_df[[entity_col, "lower", "upper"]], on=entity_col, how="left"
+    )
+    ratings_df["lower"] = np.round(ratings_df["lower"].astype(float), decimals=0)
+    ratings_df["upper"] = np.round(ratings_df["upper"].astype(float), decimals=0)
+    return ratings_df
+
+
+# slow callbacks run here so they never hold up cheap ones
+jobs = JobQueue(max_workers=int(os.environ.get("JOB_WORKERS", 2)))
+
+
+def no_progress(fraction, message=""):
+    pass
+
 
 # app
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
 
-app.layout = html.Div(
-    [
-        html.H1("Terraforming Mars Statistics"),
-        dcc.Tabs(
-            id="app-tabs",
-            value="most-recent-game-tab",
-            children=[
-                dcc.Tab(label="Most Recent Game", value="most-recent-game-tab"),
-                dcc.Tab(label="Player Statistics", value="player-stats-tab"),
-                dcc.Tab(label="Player ELO", value="player-elo-tab"),
-                dcc.Tab(label="Corporation ELO", value="corporation-elo-tab"),
-                dcc.Tab(label="View Raw Data", value="raw-data-tab"),
-            ],
-        ),
-        html.Div(id="tab-content"),
-        html.Br(),
-        html.Div(
-            [
-                dcc.Markdown(
-                    "Dashboard built by Anthony Rentsch. To view the source code or download the raw data, visit my [terraforming-mars-stats Github repository](https://github.com/AnthonyRentsch/terraforming-mars-stats)",
-                    className="footer",
-                )
-            ]
-        ),
-    ]
-)
+
+def serve_layout():
+    return html.Div(
+        [
+            dcc.Store(id="session-id", data=uuid.uuid4().hex),
+            html.H1("Terraforming Mars Statistics"),
+            dcc.Tabs(
+                id="app-tabs",
+                value="most-recent-game-tab",
+                children=[
+                    dcc.Tab(label="Most Recent Game", value="most-recent-game-tab"),
+                    dcc.Tab(label="Player Statistics", value="player-stats-tab"),
+                    dcc.Tab(label="Player ELO", value="player-elo-tab"),
+                    dcc.Tab(label="Corporation ELO", value="corporation-elo-tab"),
+                    dcc.Tab(label="Head-to-Head", value="head-to-head-tab"),
+                    dcc.Tab(label="View Raw Data", value="raw-data-tab"),
+                ],
+            ),
+            html.Div(id="tab-content"),
+            html.Br(),
+            html.Div(
+                [
+                    dcc.Markdown(
+                        "Dashboard built by Anthony Rentsch. To view the source code or download the raw data, visit my [terraforming-mars-stats Github repository](https://github.com/AnthonyRentsch/terraforming-mars-stats)",
+                        className="footer",
+                    )
+                ]
+            ),
+        ]
+    )
+
+
+app.layout = serve_layout
 
 
 @app.callback(Output("tab-content", "children"), Input("app-tabs", "value"))
 def render_content(tab):
+    state = states.current
+    df = state.df
     if tab == "most-recent-game-tab":
-        return html.Div(
-            [
-                html.H3(
-                    f"{most_recent_game_date}", style={"text-decoration": "underline"}
-                ),
-                dcc.Markdown(
-                    f"""**Board**: {most_recent_game_df['board'][0]}
-            \n**Expansions**: {", ".join([col for col in ['prelude','venus','colonies','turmoil','bgg'] if most_recent_game_df[col].sum() == most_recent_game_df.shape[0]])}
-            \n**Award 1**: {most_recent_game_df['award_1_name'][0]} (funder = {most_recent_game_df['award_1_funder'][0]})
-            \n**Award 2**: {most_recent_game_df['award_2_name'][0]} (funder = {most_recent_game_df['award_2_funder'][0]})
-            \n**Award 3**: {most_recent_game_df['award_3_name'][0]} (funder = {most_recent_game_df['award_3_funder'][0]})
-            \n**Milestone 1**: {most_recent_game_df['milestone_1_name'][0]}
-            \n**Milestone 2**: {most_recent_game_df['milestone_2_name'][0]}
-            \n**Milestone 3**: {most_recent_game_df['milestone_3_name'][0]}""",
-                    className="p",
-                ),
-                dash_table.DataTable(
-                    id="most-recent-game-table",
-                    columns=[
-                        {"name": i, "id": i}
-                        for i in most_recent_game_df[
-                            [
-                                "player",
-                                "corporation",
-                                "terraform_rating",
-                                "award_1_points",
-                                "award_2_points",
-                                "award_3_points",
-                                "milestone_1_points",
-                                "milestone_2_points",
-                                "milestone_3_points",
-                                "num_greeneries",
-                                "num_cities",
-                                "num_colonies",
-                                "num_greenery_adjacencies",
-                                "card_points",
-                                "total_points",
-                            ]
-                        ]
-                        .set_index("player")
-                        .T.reset_index()
-                        .columns
-                    ],
-                    data=most_recent_game_df[
-                        [
-                            "player",
-                            "corporation",
-                            "terraform_rating",
-                            "award_1_points",
-                            "award_2_points",
-                            "award_3_points",
-                            "milestone_1_points",
-                            "milestone_2_points",
-                            "milestone_3_points",
-                            "num_greeneries",
-                            "num_cities",
-                            "num_colonies",
-                            "num_greenery_adjacencies",
-                            "card_points",
-                            "total_points",
-                        ]
-                    ]
-                    .set_index("player")
-                    .T.reset_index()
-                    .to_dict("records"),
-                    style_header={
-                        "backgroundColor": "rgb(30, 30, 30)",
-                        "color": "white",
-                    },
-                    style_data={"backgroundColor": "rgb(50, 50, 50)", "color": "white"},
-                    style_table={
-                        "width": "50%",
-                        "margin-left": "auto",
-                        "margin-right": "auto",
-                    },
-                    include_headers_on_copy_paste=True,
-                ),
-            ]
+        return make_game_summary_div(
+            state.most_recent_game,
+            f"{state.most_recent_game_date}",
+            "most-recent-game-table",
         )
     elif tab == "player-stats-tab":
         return html.Div(
@@ -150,10 +256,7 @@ def render_content(tab):
                 html.H4("Players Included (in output)"),
                 dcc.Dropdown(
                     id="player-win-rate-players-included-dropdown",
-                    options=[
-                        {"label": name, "value": name}
-                        for name in sorted(df.player.unique())
-                    ],
+                    options=[{"label": name, "value": name} for name in state.players],
                     multi=True,
                     value=["Ben", "Ezra", "Matt", "Pat", "Tony"],
                 ),
@@ -163,13 +266,15 @@ def render_content(tab):
                 html.H4("Choose a player to learn more about"),
                 dcc.Dropdown(
                     id="player-drill-down-dropdown",
-                    options=[
-                        {"label": name, "value": name}
-                        for name in sorted(df.player.unique())
-                    ],
+                    options=[{"label": name, "value": name} for name in state.players],
                     value="Tony",
                 ),
                 html.Div(id="player-drill-down-div"),
+                dcc.Checklist(
+                    id="player-points-on-cards-kde-checklist",
+                    options=[{"label": "Show density curves", "value": "show"}],
+                    value=[],
+                ),
                 html.Div(id="player-points-on-cards-div"),
             ]
         )
@@ -202,14 +307,20 @@ def render_content(tab):
                 html.H4("Players Included (in output)"),
                 dcc.Dropdown(
                     id="player-elo-players-included-dropdown",
-                    options=[
-                        {"label": name, "value": name}
-                        for name in sorted(df.player.unique())
-                    ],
+                    options=[{"label": name, "value": name} for name in state.players],
                     multi=True,
                     value=["Ben", "Ezra", "Matt", "Pat", "Tony"],
                 ),
+                dcc.Checklist(
+                    id="player-elo-intervals-checklist",
+                    options=[
+                        {"label": "Show 95% bootstrap intervals", "value": "show"}
+                    ],
+                    value=[],
+                ),
                 html.Div(id="player-elo-div"),
+                dcc.Store(id="player-elo-job"),
+                dcc.Interval(id="player-elo-poll", interval=250, disabled=True),
             ]
         )
     elif tab == "corporation-elo-tab":
@@ -220,7 +331,7 @@ def render_content(tab):
                     id="corp-elo-expansion-included-dropdown",
                     options=[
                         {"label": corp_origin, "value": corp_origin}
-                        for corp_origin in sorted(df.corporation_origin.unique())
+                        for corp_origin in state.corporation_origins
                     ],
                     multi=True,
                     value=["Base"],
@@ -234,7 +345,33 @@ def render_content(tab):
                     ],
                     value="linear",
                 ),
+                dcc.Checklist(
+                    id="corp-elo-intervals-checklist",
+                    options=[
+                        {"label": "Show 95% bootstrap intervals", "value": "show"}
+                    ],
+                    value=[],
+                ),
                 html.Div(id="corp-elo-div"),
+                dcc.Store(id="corp-elo-job"),
+                dcc.Interval(id="corp-elo-poll", interval=250, disabled=True),
+            ]
+        )
+    elif tab == "head-to-head-tab":
+        return html.Div(
+            [
+                html.H4("Compare"),
+                dcc.RadioItems(
+                    id="h2h-entity-radio",
+                    options=[
+                        {"label": "Players", "value": "player"},
+                        {"label": "Corporations", "value": "corporation"},
+                    ],
+                    value="player",
+                ),
+                dcc.Dropdown(id="h2h-entity-a-dropdown"),
+                dcc.Dropdown(id="h2h-entity-b-dropdown"),
+                html.Div(id="h2h-div"),
             ]
         )
     elif tab == "raw-data-tab":
@@ -243,8 +380,10 @@ def render_content(tab):
                 html.Br(),
                 dash_table.DataTable(
                     id="raw-data-table",
-                    columns=[{"name": i, "id": i} for i in df.columns],
-                    data=df.to_dict("records"),
+                    columns=[
+                        {"name": i, "id": i, "type": raw_data_column_type(df[i])}
+                        for i in df.columns
+                    ],
                     style_header={
                         "backgroundColor": "rgb(30, 30, 30)",
                         "color": "white",
@@ -255,8 +394,15 @@ def render_content(tab):
                         "overflowX": "scroll",
                         "minWidth": "100%",
                     },
-                    filter_action="native",
+                    # only the requested page is sent, see update_raw_data_table()
+                    page_action="custom",
+                    page_current=0,
                     page_size=50,
+                    filter_action="custom",
+                    filter_query="",
+                    sort_action="custom",
+                    sort_mode="multi",
+                    sort_by=[],
                     fixed_columns={"headers": True, "data": 3},
                 ),
             ]
@@ -275,22 +421,107 @@ def render_content(tab):
 #########################################################################################################
 #########################################################################################################
 
+
+### RAW DATA ###
+# matching row positions per dataset version, filter and sort, so paging through one
+# result does not re-run its filter
+raw_data_positions_cache = LRUCache(max_entries=64)
+
+
+def raw_data_column_type(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(series) and not isinstance(
+        series.dtype, pd.CategoricalDtype
+    ):
+        return "numeric"
+    return "text"
+
+
+@app.callback(
+    Output("raw-data-table", "data"),
+    Output("raw-data-table", "page_count"),
+    Input("raw-data-table", "page_current"),
+    Input("raw-data-table", "page_size"),
+    Input("raw-data-table", "filter_query"),
+    Input("raw-data-table", "sort_by"),
+)
+def update_raw_data_table(page_current, page_size, filter_query, sort_by):
+    if games_db is not None:
+        page_df, page_count = games_db.query_page(
+            filter_query, sort_by, page_current, page_size
+        )
+        return (
+            page_df.assign(date=page_df.date.dt.strftime("%Y-%m-%d")).to_dict(
+                "records"
+            ),
+            page_count,
+        )
+
+    state = states.current
+    sort_key = tuple(
+        (sort_key["column_id"], sort_key["direction"]) for sort_key in sort_by or []
+    )
+    positions = raw_data_positions_cache.get_or_compute(
+        (state.data_version, filter_query or "", sort_key),
+        lambda: sort_positions(
+            state.df, filter_positions(state.df, filter_query), sort_by
+        ),
+    )
+    page_df, page_count = page(state.df, positions, page_current, page_size)
+    return (
+        page_df.assign(date=page_df.date.dt.strftime("%Y-%m-%d")).to_dict("records"),
+        page_count,
+    )
+
+
+### GAME SUMMARIES ###
+def make_game_summary_div(summary, title, table_id):
+    """
+    Args:
+        summary : dict
+            From tm_stats.aggregates.game_summary()
+        title : str
+        table_id : str
+    """
+    return html.Div(
+        [
+            html.H3(title, style={"text-decoration": "underline"}),
+            dcc.Markdown(
+                f"""**Board**: {summary['board']}
+            \n**Expansions**: {summary['expansions']}
+            \n**Award 1**: {summary['award_1_name']} (funder = {summary['award_1_funder']})
+            \n**Award 2**: {summary['award_2_name']} (funder = {summary['award_2_funder']})
+            \n**Award 3**: {summary['award_3_name']} (funder = {summary['award_3_funder']})
+            \n**Milestone 1**: {summary['milestone_1_name']}
+            \n**Milestone 2**: {summary['milestone_2_name']}
+            \n**Milestone 3**: {summary['milestone_3_name']}""",
+                className="p",
+            ),
+            dash_table.DataTable(
+                id=table_id,
+                columns=[{"name": i, "id": i} for i in summary["score_columns"]],
+                data=summary["score_data"],
+                style_header={"backgroundColor": "rgb(30, 30, 30)", "color": "white"},
+                style_data={"backgroundColor": "rgb(50, 50, 50)", "color": "white"},
+                style_table={
+                    "width": "50%",
+                    "margin-left": "auto",
+                    "margin-right": "auto",
+                },
+                include_headers_on_copy_paste=True,
+            ),
+        ]
+    )
+
+
 ### PLAYER STATISTICS ###
 @app.callback(
     Output("player-win-rate-div", "children"),
     Input("player-win-rate-players-included-dropdown", "value"),
 )
 def get_player_win_rates_table(players_to_include):
-    player_win_rates_df_ = (
-        df.groupby("player")
-        .agg(
-            wins=("is_winner", "sum"),
-            games=("is_winner", "count"),
-            win_rate=("is_winner", "mean"),
-        )
-        .sort_values(by="win_rate", ascending=False)
-        .reset_index()
-    )
+    player_win_rates_df_ = states.current.player_win_rates
 
     player_win_rates_df = player_win_rates_df_[
         player_win_rates_df_.player.isin(players_to_include)
@@ -320,96 +551,19 @@ def get_player_win_rates_table(players_to_include):
     Input("player-drill-down-dropdown", "value"),
 )
 def make_player_most_recent_win_div(player):
-    player_df = df[df.player == player]
-
-    if player_df["is_winner"].sum() > 0:
-        player_most_recent_win_game_id = (
-            player_df[player_df["is_winner"] == 1]
-            .sort_values(by="date", ascending=False)
-            .head(1)["game_id"]
-            .values[0]
-        )
-        player_most_recent_win_df = df[df.game_id == player_most_recent_win_game_id]
-
-        return html.Div(
-            [
-                html.H3(
-                    f'Most recent win: {player_most_recent_win_df["date"].values[0]}',
-                    style={"text-decoration": "underline"},
-                ),
-                dcc.Markdown(
-                    f"""**Board**: {player_most_recent_win_df['board'].values[0]}
-            \n**Expansions**: {", ".join([col for col in ['prelude','venus','colonies','turmoil','bgg'] if player_most_recent_win_df[col].sum() == player_most_recent_win_df.shape[0]])}
-            \n**Award 1**: {player_most_recent_win_df['award_1_name'].values[0]} (funder = {player_most_recent_win_df['award_1_funder'].values[0]})
-            \n**Award 2**: {player_most_recent_win_df['award_2_name'].values[0]} (funder = {player_most_recent_win_df['award_2_funder'].values[0]})
-            \n**Award 3**: {player_most_recent_win_df['award_3_name'].values[0]} (funder = {player_most_recent_win_df['award_3_funder'].values[0]})
-            \n**Milestone 1**: {player_most_recent_win_df['milestone_1_name'].values[0]}
-            \n**Milestone 2**: {player_most_recent_win_df['milestone_2_name'].values[0]}
-            \n**Milestone 3**: {player_most_recent_win_df['milestone_3_name'].values[0]}""",
-                    className="p",
-                ),
-                dash_table.DataTable(
-                    id="most-recent-player-win-table",
-                    columns=[
-                        {"name": i, "id": i}
-                        for i in player_most_recent_win_df[
-                            [
-                                "player",
-                                "corporation",
-                                "terraform_rating",
-                                "award_1_points",
-                                "award_2_points",
-                                "award_3_points",
-                                "milestone_1_points",
-                                "milestone_2_points",
-                                "milestone_3_points",
-                                "num_greeneries",
-                                "num_cities",
-                                "num_colonies",
-                                "num_greenery_adjacencies",
-                                "card_points",
-                                "total_points",
-                            ]
-                        ]
-                        .set_index("player")
-                        .T.reset_index()
-                        .columns
-                    ],
-                    data=player_most_recent_win_df[
-                        [
-                            "player",
-                            "corporation",
-                            "terraform_rating",
-                            "award_1_points",
-                            "award_2_points",
-                            "award_3_points",
-                            "milestone_1_points",
-                            "milestone_2_points",
-                            "milestone_3_points",
-                            "num_greeneries",
-                            "num_cities",
-                            "num_colonies",
-                            "num_greenery_adjacencies",
-                            "card_points",
-                            "total_points",
-                        ]
-                    ]
-                    .set_index("player")
-                    .T.reset_index()
-                    .to_dict("records"),
-                    style_header={
-                        "backgroundColor": "rgb(30, 30, 30)",
-                        "color": "white",
-                    },
-                    style_data={"backgroundColor": "rgb(50, 50, 50)", "color": "white"},
-                    style_table={
-                        "width": "50%",
-                        "margin-left": "auto",
-                        "margin-right": "auto",
-                    },
-                    include_headers_on_copy_paste=True,
-                ),
-            ]
+    state = states.current
+    if games_db is not None:
+        win_df = games_db.most_recent_win(player)
+        summary = game_summary(win_df) if win_df.shape[0] else None
+    else:
+        game_id = state.last_wins.get(player)
+        summary = None if game_id is None else state.game_summaries[game_id]
+
+    if summary is not None:
+        return make_game_summary_div(
+            summary,
+            f"Most recent win: {summary['date']}",
+            "most-recent-player-win-table",
         )
 
     else:
@@ -423,101 +577,72 @@ def make_player_most_recent_win_div(player):
 @app.callback(
     Output("player-points-on-cards-div", "children"),
     Input("player-drill-down-dropdown", "value"),
+    Input("player-points-on-cards-kde-checklist", "value"),
 )
-def make_player_points_on_card_div(player):
-    player_df = df[df.player == player]
-    fig = make_subplots(
-        rows=1,
-        cols=4,
-        subplot_titles=[f"{i}-player" for i in sorted(df.num_players.unique())],
-    )
-
-    for i, n_players in enumerate(sorted(df.num_players.unique())):
-        player_df_num_players = player_df[player_df.num_players == n_players]
-        other_player_df_num_players = df[
-            (df.player != player) & (df.num_players == n_players)
-        ]
-
-        hist_data = [
-            player_df_num_players.card_points,
-            other_player_df_num_players.card_points,
-        ]
-
-        group_labels = [player, "Field"]
-        colors = ["blue", "grey"]
-
-        data_ = ff.create_distplot(hist_data, group_labels, colors=colors, bin_size=5)
-
-        if i > 0:
-            fig.add_trace(
-                go.Histogram(data_["data"][0], marker_color="blue", showlegend=False),
-                row=1,
-                col=i + 1,
-            )
-            fig.add_trace(
-                go.Histogram(data_["data"][1], marker_color="grey", showlegend=False),
-                row=1,
-                col=i + 1,
-            )
-        else:
-            fig.add_trace(
-                go.Histogram(data_["data"][0], marker_color="blue"), row=1, col=i + 1
-            )
-            fig.add_trace(
-                go.Histogram(data_["data"][1], marker_color="grey"), row=1, col=i + 1
-            )
-
-    #     fig.add_trace(go.Scatter(data_['data'][2], line=dict(color='blue', width=0.5)),
-    #                   row=1, col=i+1)
-    #     fig.add_trace(go.Scatter(data_['data'][3], line=dict(color='grey', width=0.5)),
-    #                   row=1, col=i+1)
-
-    fig.update_layout(
-        title_text=f"Points from Cards: {player} vs. Field",
-        title_x=0.5,
-        plot_bgcolor="rgba(0,0,0,0)",
+def make_player_points_on_card_div(player, kde):
+    state = states.current
+    kde = "show" in (kde or [])
+    fig = player_points_on_card_cache.get_or_compute(
+        (state.data_version, player, kde),
+        lambda: make_plotly_card_points_plot(state.card_point_histograms, player, kde),
     )
-    fig.update_yaxes(showticklabels=False)
     return html.Div([dcc.Graph(id="player-points-on-card-fig", figure=fig)])
 
 
 ### PLAYER ELO ###
-@app.callback(
-    Output("player-elo-div", "children"),
-    Input("player-elo-options-dropdown", "value"),
-    Input("player-elo-score-function-dropdown", "value"),
-    Input("player-elo-players-included-dropdown", "value"),
-)
-def make_player_elo_div(num_player_category, score_fun, included_players):
-
-    if num_player_category == "all":
-        player_ratings_df = compute_historical_player_ratings(
-            df=df, score_fun=score_fun
-        )
-    elif num_player_category == "two-player":
-        player_ratings_df = compute_historical_player_ratings(
-            df=df[df.num_players == 2], score_fun=score_fun
-        )
-    elif num_player_category == "non-two-player":
-        player_ratings_df = compute_historical_player_ratings(
-            df=df[df.num_players != 2], score_fun=score_fun
-        )
+def make_player_elo_div(
+    state,
+    num_player_category,
+    score_fun,
+    included_players,
+    intervals,
+    progress=no_progress,
+):
+    progress(0.1, "Computing ratings")
+    player_ratings_df = get_player_ratings(
+        state,
+        num_player_category,
+        score_fun,
+        progress=stage_progress(progress, 0.1, 0.4, "Computing ratings"),
+    )
 
     player_ratings_plot = make_plotly_player_ts_ratings_plot(
         player_ratings_df[player_ratings_df.player.isin(included_players)]
     )
 
-    most_recent_player_ratings_df = player_ratings_df[
-        (player_ratings_df.player.isin(included_players))
-        & (player_ratings_df.date == max(player_ratings_df.date))
-    ][["player", "rating"]].sort_values(by="rating", ascending=False)
+    most_recent_player_ratings_df = current_ratings(
+        player_ratings_df[player_ratings_df.player.isin(included_players)], "player"
+    )[["player", "rating"]].sort_values(by="rating", ascending=False)
     most_recent_player_ratings_df["rating"] = np.round(
         most_recent_player_ratings_df["rating"].astype(float), decimals=0
     )
 
+    intervals_fig = []
+    if "show" in intervals:
+        progress(0.4, "Bootstrapping rating intervals")
+        ci_df = get_rating_intervals(
+            state,
+            "player",
+            num_player_category,
+            score_fun,
+            progress=stage_progress(
+                progress, 0.4, 0.95, "Bootstrapping rating intervals"
+            ),
+        )
+        ci_df = ci_df[ci_df.player.isin(included_players)]
+        most_recent_player_ratings_df = add_rating_intervals(
+            most_recent_player_ratings_df, ci_df, "player"
+        )
+        intervals_fig = [
+            dcc.Graph(
+                id="player-rating-intervals-fig",
+                figure=make_plotly_current_ratings_plot(ci_df, "player"),
+            )
+        ]
+
     return html.Div(
         [
-            html.H3(f"Current ratings (as of {most_recent_game_date})"),
+            html.H3(f"Current ratings (as of {state.most_recent_game_date})"),
             dash_table.DataTable(
                 id="player-ratings-table",
                 columns=[
@@ -533,6 +658,7 @@ def make_player_elo_div(num_player_category, score_fun, included_players):
                 },
                 include_headers_on_copy_paste=True,
             ),
+            *intervals_fig,
             html.Br(),
             dcc.Graph(id="player-rating-ts-fig", figure=player_ratings_plot),
         ]
@@ -540,33 +666,58 @@ def make_player_elo_div(num_player_category, score_fun, included_players):
 
 
 ### CORP ELO ###
-@app.callback(
-    Output("corp-elo-div", "children"),
-    Input("corp-elo-expansion-included-dropdown", "value"),
-    Input("corp-elo-score-function-dropdown", "value"),
-)
-def make_corp_elo_div(corps_to_display, score_fun):
-    corp_ratings_df = compute_historical_corp_ratings(df=df, score_fun=score_fun)
+def make_corp_elo_div(
+    state, corps_to_display, score_fun, intervals, progress=no_progress
+):
+    progress(0.1, "Computing ratings")
+    corp_ratings_df = get_corp_ratings(
+        state,
+        score_fun,
+        progress=stage_progress(progress, 0.1, 0.4, "Computing ratings"),
+    )
     corp_ratings_plot = make_plotly_corp_ts_ratings_plot(
         corp_ratings_df=corp_ratings_df[
             corp_ratings_df.corporation_origin.isin(corps_to_display)
         ],
-        df=df,
+        df=state.df,
     )
 
-    most_recent_corp_ratings_df = corp_ratings_df[
-        (corp_ratings_df.corporation_origin.isin(corps_to_display))
-        & (corp_ratings_df.date == max(corp_ratings_df.date))
-    ][["corporation", "corporation_origin", "rating"]].sort_values(
+    most_recent_corp_ratings_df = current_ratings(
+        corp_ratings_df[corp_ratings_df.corporation_origin.isin(corps_to_display)],
+        "corporation",
+    )[["corporation", "corporation_origin", "rating"]].sort_values(
         by="rating", ascending=False
     )
     most_recent_corp_ratings_df["rating"] = np.round(
         most_recent_corp_ratings_df["rating"].astype(float), decimals=0
     )
 
+    intervals_fig = []
+    if "show" in intervals:
+        progress(0.4, "Bootstrapping rating intervals")
+        ci_df = get_rating_intervals(
+            state,
+            "corporation",
+            "all",
+            score_fun,
+            progress=stage_progress(
+                progress, 0.4, 0.95, "Bootstrapping rating intervals"
+            ),
+        )
+        ci_df = ci_df[ci_df.corporation.isin(most_recent_corp_ratings_df.corporation)]
+        most_recent_corp_ratings_df = add_rating_intervals(
+            most_recent_corp_ratings_df, ci_df, "corporation"
+        )
+        intervals_fig = [
+            dcc.Graph(
+                id="corp-rating-intervals-fig",
+                figure=make_plotly_current_ratings_plot(ci_df, "corporation"),
+            )
+        ]
+
     return html.Div(
         [
-            html.H3(f"Current ratings (as of {most_recent_game_date})"),
+            html.H3(f"Current ratings (as of {state.most_recent_game_date})"),
             dash_table.DataTable(
                 id="corp-ratings-table",
                 columns=[
@@ -582,11 +733,142 @@ def make_corp_elo_div(corps_to_display, score_fun):
                 },
                 include_headers_on_copy_paste=True,
             ),
+            *intervals_fig,
             html.Br(),
             dcc.Graph(id="corp-rating-ts-fig", figure=corp_ratings_plot),
         ]
     )
 
 
+### BACKGROUND JOBS ###
+def render_job(job_id):
+    """
+    Returns:
+        children : the job's result, or a progress bar while it is still running
+        poll_disabled : bool
+    """
+    status = jobs.status(job_id) if job_id else None
+    if status is None:
+        return html.Div(), True
+    if status["state"] == "done":
+        return jobs.result(job_id), True
+    if status["state"] == "failed":
+        return html.Div([html.H3("Something went wrong, please try again.")]), True
+    if status["state"] == "cancelled":
+        return dash.no_update, True
+    return (
+        html.Div(
+            [
+                html.Progress(value=str(status["progress"]), max="1"),
+                html.P(status["message"]),
+            ]
+        ),
+        False,
+    )
+
+
+@app.callback(
+    Output("player-elo-job", "data"),
+    Input("player-elo-options-dropdown", "value"),
+    Input("player-elo-score-function-dropdown", "value"),
+    Input("player-elo-players-included-dropdown", "value"),
+    Input("player-elo-intervals-checklist", "value"),
+    State("session-id", "data"),
+)
+def submit_player_elo_job(
+    num_player_category, score_fun, included_players, intervals, session_id
+):
+    return jobs.submit(
+        f"{session_id}-player-elo",
+        make_player_elo_div,
+        states.current,
+        num_player_category,
+        score_fun,
+        included_players,
+        intervals,
+    )
+
+
+@app.callback(
+    Output("corp-elo-job", "data"),
+    Input("corp-elo-expansion-included-dropdown", "value"),
+    Input("corp-elo-score-function-dropdown", "value"),
+    Input("corp-elo-intervals-checklist", "value"),
+    State("session-id", "data"),
+)
+def submit_corp_elo_job(corps_to_display, score_fun, intervals, session_id):
+    return jobs.submit(
+        f"{session_id}-corp-elo",
+        make_corp_elo_div,
+        states.current,
+        corps_to_display,
+        score_fun,
+        intervals,
+    )
+
+
+def poll_job(job_id, n_intervals):
+    return render_job(job_id)
+
+
+for name in ["player-elo", "corp-elo"]:
+    app.callback(
+        Output(f"{name}-div", "children"),
+        Output(f"{name}-poll", "disabled"),
+        Input(f"{name}-job", "data"),
+        Input(f"{name}-poll", "n_intervals"),
+    )(poll_job)
+
+
+### HEAD-TO-HEAD ###
+@app.callback(
+    Output("h2h-entity-a-dropdown", "options"),
+    Output("h2h-entity-a-dropdown", "value"),
+    Output("h2h-entity-b-dropdown", "options"),
+    Output("h2h-entity-b-dropdown", "value"),
+    Input("h2h-entity-radio", "value"),
+)
+def set_h2h_options(entity_col):
+    names = sorted(states.current.h2h_indexes[entity_col]["entities"])
+    options = [{"label": name, "value": name} for name in names]
+    if entity_col == "player":
+        return options, "Tony", options, "Matt"
+    return options, names[0], options, names[1]
+
+
+@app.callback(
+    Output("h2h-div", "children"),
+    Input("h2h-entity-radio", "value"),
+    Input("h2h-entity-a-dropdown", "value"),
+    Input("h2h-entity-b-dropdown", "value"),
+)
+def make_h2h_div(entity_col, entity_a, entity_b):
+    record = head_to_head(states.current.h2h_indexes[entity_col], entity_a, entity_b)
+    if record is None or record["games"] == 0:
+        return html.Div(
+            [html.H3("No games together yet!", style={"text-decoration": "underline"})]
+        )
+
+    h2h_df = pd.DataFrame([record]).round(1)
+    return html.Div(
+        [
+            html.H3(f"{entity_a} vs. {entity_b}"),
+            dash_table.DataTable(
+                id="h2h-table",
+                columns=[{"name": i, "id": i} for i in h2h_df.columns],
+                data=h2h_df.to_dict("records"),
+                style_header={"backgroundColor": "rgb(30, 30, 30)", "color": "white"},
+                style_data={"backgroundColor": "rgb(50, 50, 50)", "color": "white"},
+                style_table={
+                    "width": "50%",
+                    "margin-left": "auto",
+                    "margin-right": "auto",
+                },
+                include_headers_on_copy_paste=True,
+            ),
+        ]
+    )
+
+
 if __name__ == "__main__":
     app.run_server(port=8000, host="127.0.0.1", debug=True)
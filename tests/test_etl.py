@@ -0,0 +1,74 @@
+from tm_stats.etl import format_data, format_raw_sheets, output_columns
+
+
+def worksheet_values(award_names):
+    return [
+        ["Category", "Ann", "Ben"],
+        ["Base TR Score", "30", "25"],
+        ["Awards (funder):", "", ""],
+        [award_names[0], "5", "2"],
+        [award_names[1], "0", "5"],
+        [award_names[2], "5", "0"],
+        ["Milestones (funder):", "", ""],
+        ["Mayor", "5", "0"],
+        ["Builder", "0", "5"],
+        ["Gardener", "0", "0"],
+        ["Greeneries", "3", "4"],
+        ["Cities (for ref, not points)", "2", "3"],
+        ["Greeneries adj to Cities", "4", "6"],
+        ["Points from Cards:", "10", "12"],
+        ["Total", "62", "59"],
+    ]
+
+
+def raw_sheet(title, values):
+    return {"spreadsheet": "Mars", "title": title, "values": values}
+
+
+def test_awards_without_funders():
+    df = format_data(
+        worksheet_values(["Banker", "Miner", "Thermalist"]),
+        "2022-01-11 (Tharsis)",
+        "Mars",
+    )
+    assert df["award_1_name"].tolist() == ["Banker", "Banker"]
+    assert df["award_1_funder"].tolist() == ["UNKNOWN", "UNKNOWN"]
+    assert df["milestone_3_name"].tolist() == ["Gardener", "Gardener"]
+    assert df["is_winner"].tolist() == [1, 0]
+
+
+def test_titles_without_board():
+    df = format_data(
+        worksheet_values(["Banker", "Miner", "Thermalist"]), "2022-01-11", "Mars"
+    )
+    assert df["board"].tolist() == ["Tharsis", "Tharsis"]
+    assert df[["prelude", "venus", "colonies", "turmoil"]].to_numpy().sum() == 0
+    assert df["date"].astype(str).str[:10].unique().tolist() == ["2022-01-11"]
+
+
+def test_awards_with_and_without_funders_in_one_batch():
+    df = format_raw_sheets(
+        [
+            raw_sheet(
+                "2022-01-09 (Tharsis)",
+                worksheet_values(["Banker (Ann)", "Miner (Ben)", "Thermalist (Ann)"]),
+            ),
+            raw_sheet(
+                "2022-01-11 (Tharsis)",
+                worksheet_values(["Banker", "Miner", "Thermalist"]),
+            ),
+        ]
+    )
+    assert df["award_2_funder"].tolist() == ["Ben", "Ben", "UNKNOWN", "UNKNOWN"]
+
+
+def test_worksheets_without_scores_are_skipped():
+    blank = raw_sheet("2022-01-10 (Tharsis)", [["Category", "Ann", "Ben"]])
+    df = format_raw_sheets(
+        [blank, raw_sheet("2022-01-11 (Tharsis)", worksheet_values(["A", "B", "C"]))]
+    )
+    assert df["date"].astype(str).str[:10].unique().tolist() == ["2022-01-11"]
+
+    df = format_raw_sheets([blank])
+    assert df.shape[0] == 0
+    assert set(output_columns) <= set(df.columns)
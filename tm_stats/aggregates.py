@@ -0,0 +1,168 @@
+"""
+Tables the dashboard shows that only change when the data does.
+
+build_aggregates() runs once per dataset version (see tm_stats.state), so callbacks pick
+rows out of small precomputed tables instead of grouping or masking the full dataset on
+every dropdown change.
+"""
+import numpy as np
+import pandas as pd
+
+from tm_stats.dataset import NULLABLE_INTEGER_COLUMNS
+from tm_stats.histograms import build_card_point_histograms
+from tm_stats.row_index import RowIndex
+
+EXPANSION_COLUMNS = ["prelude", "venus", "colonies", "turmoil", "bgg"]
+
+SCORE_COLUMNS = [
+    "player",
+    "corporation",
+    "terraform_rating",
+    "award_1_points",
+    "award_2_points",
+    "award_3_points",
+    "milestone_1_points",
+    "milestone_2_points",
+    "milestone_3_points",
+    "num_greeneries",
+    "num_cities",
+    "num_colonies",
+    "num_greenery_adjacencies",
+    "card_points",
+    "total_points",
+]
+
+
+def player_win_rates(df):
+    """
+    Returns:
+        win_rates_df : pd.DataFrame
+            player, wins, games and win_rate, best win rate first
+    """
+    return (
+        df.groupby("player", observed=True)
+        .agg(
+            wins=("is_winner", "sum"),
+            games=("is_winner", "count"),
+            win_rate=("is_winner", "mean"),
+        )
+        .sort_values(by="win_rate", ascending=False)
+        .reset_index()
+    )
+
+
+def last_wins(index):
+    """
+    Args:
+        index : tm_stats.row_index.RowIndex
+    Returns:
+        last_wins : dict
+            player -> game_id of their most recent win; players without a win are left out
+    """
+    df = index.df
+    dates = df["date"].to_numpy()
+    is_winner = df["is_winner"].to_numpy() == 1
+    game_ids = df["game_id"].to_numpy()
+    wins = {}
+    for player in index.values("player"):
+        positions = index.positions("player", player)
+        positions = positions[is_winner[positions]]
+        if len(positions):
+            # the first of the player's rows on their latest winning date
+            wins[player] = game_ids[positions[np.argmax(dates[positions])]]
+    return wins
+
+
+def game_summary(game_df):
+    """
+    Everything the game views display about one game (or one day of games).
+
+    Args:
+        game_df : pd.DataFrame
+            Every player's row of the game
+    Returns:
+        summary : dict
+            date, board, expansions, award_{i}_name/_funder, milestone_{i}_name, and the
+            score table as score_columns and score_data, one column per player
+    """
+    first = game_df.iloc[0]
+    summary = {
+        "date": first["date"].strftime("%Y-%m-%d"),
+        "board": first["board"],
+        "expansions": ", ".join(
+            col for col in EXPANSION_COLUMNS if game_df[col].sum() == game_df.shape[0]
+        ),
+    }
+    for i in [1, 2, 3]:
+        summary[f"award_{i}_name"] = first[f"award_{i}_name"]
+        summary[f"award_{i}_funder"] = first[f"award_{i}_funder"]
+    for i in [1, 2, 3]:
+        summary[f"milestone_{i}_name"] = first[f"milestone_{i}_name"]
+
+    # the score table transposed, one record per stat; built from plain lists since
+    # this runs for every game
+    players = game_df["player"].astype(str).tolist()
+    summary["score_columns"] = ["index"] + list(dict.fromkeys(players))
+    summary["score_data"] = []
+    for col in SCORE_COLUMNS[1:]:
+        values = game_df[col].tolist()
+        if col in NULLABLE_INTEGER_COLUMNS:
+            # blank scores are pd.NA, which older plotly JSON encoders reject
+            values = [None if pd.isna(value) else value for value in values]
+        record = {"index": col}
+        record.update(zip(players, values))
+        summary["score_data"].append(record)
+    return summary
+
+
+def game_summaries(index):
+    """
+    Args:
+        index : tm_stats.row_index.RowIndex
+    Returns:
+        summaries : dict
+            game_id -> game_summary() of that game
+    """
+    return {
+        game_id: game_summary(index.df.iloc[game_slice])
+        for game_id, game_slice in index.game_slices.items()
+    }
+
+
+def most_recent_games(index):
+    """
+    Returns:
+        games_df : pd.DataFrame
+            Rows of every game played on the most recent date
+    """
+    dates = index.df["date"].to_numpy()
+    most_recent_date = dates.max()
+    return index.games_rows(
+        game_id
+        for game_id, game_slice in index.game_slices.items()
+        if dates[game_slice.start] == most_recent_date
+    )
+
+
+def build_aggregates(df):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv, sorted by game (see
+            tm_stats.row_index.sort_by_game())
+    Returns:
+        aggregates : dict
+            player_win_rates, last_wins, game_summaries, most_recent_game,
+            card_point_histograms, and the sorted players and corporation_origins for
+            dropdowns
+    """
+    index = RowIndex(df)
+    return {
+        "players": sorted(df["player"].unique()),
+        "corporation_origins": sorted(df["corporation_origin"].unique()),
+        "player_win_rates": player_win_rates(df),
+        "last_wins": last_wins(index),
+        "game_summaries": game_summaries(index),
+        "most_recent_game": game_summary(most_recent_games(index)),
+        "card_point_histograms": build_card_point_histograms(df),
+    }
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def dataset_version(df):
+    """
+    Content hash of the game data, used to key anything derived from it.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+    Returns:
+        version : str
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe memo for expensive results such as Elo rating histories.
+
+    Args:
+        max_entries : int
+            Least recently used entries are evicted beyond this many.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_or_compute(self, key, compute):
+        """
+        Args:
+            key : hashable
+            compute : callable
+                Called with no arguments on a miss; its result is stored under key.
+        Returns:
+            value
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        # compute outside the lock so a slow miss does not block hits on other keys
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        Store a value computed elsewhere, e.g. one slice of a batched computation.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
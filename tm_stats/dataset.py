@@ -0,0 +1,141 @@
+"""
+Typed, columnar copy of terraforming-mars-stats.csv.
+
+The ETL writes terraforming-mars-stats.parquet next to the CSV with names stored as
+categoricals, flags and points as small integers and date as a real datetime, so loading
+it skips CSV parsing and type inference. Reading and writing it needs pyarrow.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNAR_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "terraforming-mars-stats.parquet",
+)
+
+CATEGORICAL_COLUMNS = [
+    "player",
+    "board",
+    "corporation",
+    "corporation_origin",
+    "award_1_name",
+    "award_1_funder",
+    "award_2_name",
+    "award_2_funder",
+    "award_3_name",
+    "award_3_funder",
+    "milestone_1_name",
+    "milestone_2_name",
+    "milestone_3_name",
+]
+
+INTEGER_COLUMNS = {
+    "num_players": np.int8,
+    "prelude": np.int8,
+    "venus": np.int8,
+    "colonies": np.int8,
+    "turmoil": np.int8,
+    "bgg": np.int8,
+    "is_winner": np.int8,
+}
+
+# scores, which a sheet can leave blank, so they use the nullable integer dtype
+NULLABLE_INTEGER_COLUMNS = {
+    "terraform_rating": "Int16",
+    "card_points": "Int16",
+    "total_points": "Int16",
+    "point_diff": "Int16",
+}
+
+# counts and points that are blank when they did not apply, so they need NaN
+FLOAT_COLUMNS = {
+    "num_greeneries": np.float32,
+    "num_cities": np.float32,
+    "num_colonies": np.float32,
+    "num_greenery_adjacencies": np.float32,
+    "award_1_points": np.float32,
+    "award_2_points": np.float32,
+    "award_3_points": np.float32,
+    "milestone_1_points": np.float32,
+    "milestone_2_points": np.float32,
+    "milestone_3_points": np.float32,
+    "place": np.float32,
+    "total_percent_of_points": np.float64,
+}
+
+
+def game_id_values(game_ids):
+    """
+    Legacy ids, numbered in (date, game) order before content ids, stay integers, so
+    same-day games still sort as numbers rather than as text, where "100" < "99". Content
+    ids are strings.
+
+    Args:
+        game_ids : pd.Series
+    Returns:
+        game_ids : pd.Series
+    """
+    numeric = pd.to_numeric(game_ids, errors="coerce")
+    if numeric.notna().all():
+        return numeric.astype(np.int64)
+    return game_ids.astype(str)
+
+
+def optimize_dtypes(df):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv, as read from the CSV or
+            built by the ETL
+    Returns:
+        df : pd.DataFrame
+            A copy with the columnar file's dtypes
+    """
+    df = df.copy()
+    df["game_id"] = game_id_values(df["game_id"])
+    df["date"] = pd.to_datetime(df["date"])
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    for col, dtype in INTEGER_COLUMNS.items():
+        df[col] = pd.to_numeric(df[col]).astype(dtype)
+    for col, dtype in {**NULLABLE_INTEGER_COLUMNS, **FLOAT_COLUMNS}.items():
+        # blank cells come through the ETL as empty strings
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return df
+
+
+def write_columnar(df, path=COLUMNAR_PATH):
+    optimize_dtypes(df).reset_index(drop=True).to_parquet(path, index=False)
+
+
+def _is_current(columnar_path, csv_path):
+    if columnar_path is None or not os.path.exists(columnar_path):
+        return False
+    if not os.path.exists(csv_path):
+        # a URL, or the CSV was never deployed
+        return True
+    return os.path.getmtime(columnar_path) >= os.path.getmtime(csv_path)
+
+
+def load_dataset(csv_path, columnar_path=COLUMNAR_PATH):
+    """
+    Read the columnar file if there is one that is at least as new as the CSV (and
+    pyarrow is installed), else the CSV, so a CSV replaced without rewriting the columnar
+    copy is not ignored.
+
+    Args:
+        csv_path : str
+            Path or URL of terraforming-mars-stats.csv
+        columnar_path : str
+    Returns:
+        df : pd.DataFrame
+            With the columnar file's dtypes either way
+    """
+    if _is_current(columnar_path, csv_path):
+        try:
+            return pd.read_parquet(columnar_path)
+        except ImportError:
+            pass
+    return optimize_dtypes(pd.read_csv(csv_path))
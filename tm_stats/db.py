@@ -0,0 +1,442 @@
+"""
+Optional SQLite copy of terraforming-mars-stats.csv with indexed lookups for the app.
+
+The ETL writes terraforming-mars-stats.sqlite (python -m tm_stats.etl --sqlite) with one
+row per game in games, one per player per game in player_results and the awards and
+milestones of each game in their own tables. The game_results view joins them back into
+the CSV layout, so GameDatabase queries return the same columns the app reads from the
+CSV, in the CSV's row order, while filters on player, corporation, date and game_id use
+an index instead of scanning every row. Connections are read-only, so any number of
+workers can share one file; the app reads it when TM_STATS_DB points at it.
+"""
+import math
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from tm_stats.dataset import (
+    FLOAT_COLUMNS,
+    INTEGER_COLUMNS,
+    NULLABLE_INTEGER_COLUMNS,
+    optimize_dtypes,
+)
+from tm_stats.table_query import split_filter_part
+
+DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "terraforming-mars-stats.sqlite",
+)
+
+SLOTS = [1, 2, 3]
+
+SCHEMA = """
+CREATE TABLE games (
+    game_id NUMERIC PRIMARY KEY,
+    date TEXT NOT NULL,
+    num_players INTEGER NOT NULL,
+    board TEXT,
+    prelude INTEGER,
+    venus INTEGER,
+    colonies INTEGER,
+    turmoil INTEGER,
+    bgg INTEGER
+);
+CREATE TABLE player_results (
+    game_id NUMERIC NOT NULL REFERENCES games (game_id),
+    seat INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    corporation TEXT,
+    corporation_origin TEXT,
+    terraform_rating INTEGER,
+    num_greeneries INTEGER,
+    num_cities INTEGER,
+    num_colonies INTEGER,
+    num_greenery_adjacencies INTEGER,
+    card_points INTEGER,
+    award_1_points INTEGER,
+    award_2_points INTEGER,
+    award_3_points INTEGER,
+    milestone_1_points INTEGER,
+    milestone_2_points INTEGER,
+    milestone_3_points INTEGER,
+    total_points INTEGER,
+    total_percent_of_points REAL,
+    point_diff INTEGER,
+    is_winner INTEGER,
+    place REAL,
+    PRIMARY KEY (game_id, seat)
+);
+CREATE TABLE awards (
+    game_id NUMERIC NOT NULL REFERENCES games (game_id),
+    slot INTEGER NOT NULL,
+    name TEXT,
+    funder TEXT,
+    PRIMARY KEY (game_id, slot)
+);
+CREATE TABLE milestones (
+    game_id NUMERIC NOT NULL REFERENCES games (game_id),
+    slot INTEGER NOT NULL,
+    name TEXT,
+    PRIMARY KEY (game_id, slot)
+);
+CREATE INDEX games_date ON games (date);
+CREATE INDEX player_results_player ON player_results (player);
+CREATE INDEX player_results_corporation ON player_results (corporation);
+CREATE INDEX player_results_row ON player_results (row);
+CREATE VIEW game_results AS
+SELECT
+    r.game_id,
+    g.date,
+    r.player,
+    g.num_players,
+    g.board,
+    g.prelude,
+    g.venus,
+    g.colonies,
+    g.turmoil,
+    g.bgg,
+    r.corporation,
+    r.corporation_origin,
+    r.terraform_rating,
+    r.num_greeneries,
+    r.num_cities,
+    r.num_colonies,
+    r.num_greenery_adjacencies,
+    r.card_points,
+    a1.name AS award_1_name,
+    a1.funder AS award_1_funder,
+    a2.name AS award_2_name,
+    a2.funder AS award_2_funder,
+    a3.name AS award_3_name,
+    a3.funder AS award_3_funder,
+    m1.name AS milestone_1_name,
+    m2.name AS milestone_2_name,
+    m3.name AS milestone_3_name,
+    r.award_1_points,
+    r.award_2_points,
+    r.award_3_points,
+    r.milestone_1_points,
+    r.milestone_2_points,
+    r.milestone_3_points,
+    r.total_points,
+    r.total_percent_of_points,
+    r.point_diff,
+    r.is_winner,
+    r.place,
+    r.row
+FROM player_results r
+JOIN games g ON g.game_id = r.game_id
+LEFT JOIN awards a1 ON a1.game_id = r.game_id AND a1.slot = 1
+LEFT JOIN awards a2 ON a2.game_id = r.game_id AND a2.slot = 2
+LEFT JOIN awards a3 ON a3.game_id = r.game_id AND a3.slot = 3
+LEFT JOIN milestones m1 ON m1.game_id = r.game_id AND m1.slot = 1
+LEFT JOIN milestones m2 ON m2.game_id = r.game_id AND m2.slot = 2
+LEFT JOIN milestones m3 ON m3.game_id = r.game_id AND m3.slot = 3;
+"""
+
+GAME_COLUMNS = [
+    "game_id",
+    "date",
+    "num_players",
+    "board",
+    "prelude",
+    "venus",
+    "colonies",
+    "turmoil",
+    "bgg",
+]
+
+PLAYER_RESULT_COLUMNS = [
+    "game_id",
+    "seat",
+    "row",
+    "player",
+    "corporation",
+    "corporation_origin",
+    "terraform_rating",
+    "num_greeneries",
+    "num_cities",
+    "num_colonies",
+    "num_greenery_adjacencies",
+    "card_points",
+    "award_1_points",
+    "award_2_points",
+    "award_3_points",
+    "milestone_1_points",
+    "milestone_2_points",
+    "milestone_3_points",
+    "total_points",
+    "total_percent_of_points",
+    "point_diff",
+    "is_winner",
+    "place",
+]
+
+
+def normalize_tables(df):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+    Returns:
+        tables : dict
+            Table name -> pd.DataFrame with that table's columns
+    """
+    df = df.assign(
+        game_id=df["game_id"].astype(str),
+        date=pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d"),
+        corporation_origin=df["corporation_origin"].astype(str).str.strip(),
+        # position within the game, and within the CSV, so rows come back in its order
+        seat=df.groupby("game_id", sort=False).cumcount(),
+        row=np.arange(df.shape[0]),
+    )
+    games_df = df.drop_duplicates("game_id")
+    awards_df = pd.concat(
+        [
+            games_df[["game_id", f"award_{slot}_name", f"award_{slot}_funder"]]
+            .set_axis(["game_id", "name", "funder"], axis=1)
+            .assign(slot=slot)
+            for slot in SLOTS
+        ]
+    )
+    milestones_df = pd.concat(
+        [
+            games_df[["game_id", f"milestone_{slot}_name"]]
+            .set_axis(["game_id", "name"], axis=1)
+            .assign(slot=slot)
+            for slot in SLOTS
+        ]
+    )
+    return {
+        "games": games_df[GAME_COLUMNS],
+        "player_results": df[PLAYER_RESULT_COLUMNS],
+        "awards": awards_df[awards_df["name"].notna() | awards_df["funder"].notna()][
+            ["game_id", "slot", "name", "funder"]
+        ],
+        "milestones": milestones_df[milestones_df["name"].notna()][
+            ["game_id", "slot", "name"]
+        ],
+    }
+
+
+def write_database(df, path=DB_PATH):
+    """
+    Replace the SQLite copy of the data. The new file is built on the side and renamed
+    into place, so readers never see a half-written database.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        path : str
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        for table, table_df in normalize_tables(df).items():
+            table_df.to_sql(table, conn, if_exists="append", index=False)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+NUMERIC_COLUMNS = (
+    set(INTEGER_COLUMNS) | set(NULLABLE_INTEGER_COLUMNS) | set(FLOAT_COLUMNS)
+)
+
+COMPARISONS = {"=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+class GameDatabase:
+    """
+    Read-only queries against the file written by write_database(). Results have the
+    columns and dtypes of tm_stats.dataset.load_dataset(), one row per player per game,
+    in the CSV's order (most recent game first).
+
+    Args:
+        path : str
+    """
+
+    def __init__(self, path=DB_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No database at {path}; run python -m tm_stats.etl --sqlite first"
+            )
+        self.path = path
+        # sqlite3 connections belong to the thread that opened them
+        self._local = threading.local()
+        self.columns = [
+            name
+            for _, name, *_ in self.conn.execute("PRAGMA table_info(game_results)")
+            if name != "row"
+        ]
+        # legacy integer ids are stored as integers (NUMERIC affinity) and compare as
+        # numbers, like load_dataset() keeps them; content ids are text
+        (text_ids,) = self.conn.execute(
+            "SELECT COUNT(*) FROM games WHERE typeof(game_id) = 'text'"
+        ).fetchone()
+        self._numeric_columns = NUMERIC_COLUMNS | (
+            {"game_id"} if not text_ids else set()
+        )
+
+    @property
+    def conn(self):
+        if not hasattr(self._local, "conn"):
+            self._local.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        return self._local.conn
+
+    def game_results(self, where="1", params=(), order_by="row", limit=-1, offset=0):
+        """
+        Args:
+            where : str
+                SQL condition on the game_results view
+            params : tuple
+                Values for the ? placeholders in where
+            order_by : str
+                SQL ordering; the CSV's order by default
+            limit, offset : int
+        Returns:
+            df : pd.DataFrame
+        """
+        return optimize_dtypes(
+            pd.read_sql_query(
+                f"SELECT * FROM game_results WHERE {where} ORDER BY {order_by} "
+                "LIMIT ? OFFSET ?",
+                self.conn,
+                params=tuple(params) + (limit, offset),
+            ).drop(columns="row")
+        )
+
+    def players(self):
+        return [
+            player
+            for (player,) in self.conn.execute(
+                "SELECT DISTINCT player FROM player_results ORDER BY player"
+            )
+        ]
+
+    def player_games(self, player):
+        return self.game_results("player = ?", (player,))
+
+    def corporation_games(self, corporation):
+        return self.game_results("corporation = ?", (corporation,))
+
+    def game(self, game_id):
+        return self.game_results("game_id = ?", (game_id,))
+
+    def most_recent_game(self):
+        return self.game_results(
+            "game_id IN (SELECT game_id FROM games "
+            "WHERE date = (SELECT MAX(date) FROM games))"
+        )
+
+    def most_recent_win(self, player):
+        """
+        Returns:
+            df : pd.DataFrame
+                Every player's row of the player's most recent win, empty if they have
+                not won yet
+        """
+        return self.game_results(
+            "game_id = (SELECT r.game_id FROM player_results r "
+            "JOIN games g ON g.game_id = r.game_id "
+            "WHERE r.player = ? AND r.is_winner = 1 "
+            "ORDER BY g.date DESC, r.row LIMIT 1)",
+            (player,),
+        )
+
+    def _clause_sql(self, column, operator, value):
+        """
+        SQL for one clause parsed by tm_stats.table_query.split_filter_part(), matching
+        the rows tm_stats.table_query.clause_mask() would.
+
+        Returns:
+            sql : str
+            params : list
+        """
+        if column not in self.columns:
+            return "1", []
+        name = f'"{column}"'
+        if operator == "is blank":
+            return f"{name} IS NULL", []
+        if operator == "is not blank":
+            return f"{name} IS NOT NULL", []
+
+        case_insensitive = operator.startswith("i")
+        operator = operator[1:] if case_insensitive else operator
+        text = f"CAST({name} AS TEXT)"
+        if operator == "contains":
+            if case_insensitive:
+                return f"instr(lower({text}), lower(?)) > 0", [value]
+            return f"instr({text}, ?) > 0", [value]
+        if operator == "datestartswith":
+            return f"substr({text}, 1, ?) = ?", [len(value), value]
+
+        comparison = COMPARISONS[operator]
+        if column in self._numeric_columns:
+            try:
+                return f"{name} {comparison} ?", [float(value)]
+            except (TypeError, ValueError):
+                return "0", []
+        if column == "date":
+            try:
+                timestamp = pd.Timestamp(value)
+            except ValueError:
+                return "0", []
+            # dates are stored as YYYY-MM-DD, which sorts before the same day with a time
+            date = timestamp.strftime(
+                "%Y-%m-%d"
+                if timestamp == timestamp.normalize()
+                else "%Y-%m-%d %H:%M:%S"
+            )
+            return f"{name} {comparison} ?", [date]
+        if case_insensitive:
+            return f"lower({name}) {comparison} lower(?)", [value]
+        return f"{name} {comparison} ?", [value]
+
+    def query_page(self, filter_query, sort_by, page_current, page_size):
+        """
+        Server-side filtering, sorting and paging for the raw data table, like
+        tm_stats.table_query but in SQL.
+
+        Args:
+            filter_query : str
+            sort_by : list of dict
+            page_current, page_size : int
+        Returns:
+            page_df : pd.DataFrame
+            page_count : int
+        """
+        clauses, params = ["1"], []
+        for filter_part in (filter_query or "").split(" && "):
+            column, operator, value = split_filter_part(filter_part)
+            if column is not None:
+                sql, clause_params = self._clause_sql(column, operator, value)
+                clauses.append(sql)
+                params += clause_params
+        where = " AND ".join(clauses)
+        order_by = ", ".join(
+            [
+                f'"{sort_key["column_id"]}" '
+                f'{"ASC" if sort_key["direction"] == "asc" else "DESC"} NULLS LAST'
+                for sort_key in sort_by or []
+                if sort_key["column_id"] in self.columns
+            ]
+            # ties keep the CSV's order
+            + ["row"]
+        )
+
+        (count,) = self.conn.execute(
+            f"SELECT COUNT(*) FROM game_results WHERE {where}", params
+        ).fetchone()
+        page_size = page_size or 50
+        page_count = max(1, math.ceil(count / page_size))
+        start = min(page_current or 0, page_count - 1) * page_size
+        page_df = self.game_results(where, params, order_by, page_size, start)
+        return page_df, page_count
@@ -1,10 +1,18 @@
 # adapted from: https://towardsdatascience.com/developing-a-generalized-elo-rating-system-for-multiplayer-games-b9b495e87802
 
+import hashlib
+import json
+import os
+
 import numpy as np
 import pandas as pd
 
 import plotly.express as px
 
+# long passes over the games call progress(fraction) every this many games, so a background
+# job can report how far it got and stop early once it is cancelled (see tm_stats.jobs)
+PROGRESS_EVERY = 20
+
 # scoring functions
 def linear_score(p, n):
     '''
@@ -53,7 +61,247 @@ def update_rating(current_rating, expected_score, actual_score, n, k=32):
     return current_rating + k*(n-1)*(actual_score-expected_score)
 
 ##############################################################################################################
-def compute_historical_player_ratings(df, score_fun):
+def _score_array(places, sizes, score_fun, alpha=2.):
+    '''
+    Vectorized version of linear_score/exp_score over every row at once.
+
+    Args:
+        places : np.ndarray
+            Finishing place of each row
+        sizes : np.ndarray
+            # of players in the game each row belongs to
+        score_fun : str
+            Name of scoring function to use. Must be in ['linear','exp'].
+        alpha : float
+            Base of exp_score. Ignored for linear scoring.
+    Returns:
+        observed : np.ndarray
+    '''
+    if score_fun == 'linear':
+        return (sizes - places) / (sizes * (sizes - 1) / 2)
+    # sum_{i=1}^{n-1} (alpha**(n-i) - 1), computed once per game size
+    normalizer = np.empty(len(sizes))
+    for n in np.unique(sizes):
+        normalizer[sizes == n] = np.sum([(alpha**(n-i) - 1) for i in range(1, int(n))])
+    return (alpha**(sizes - places) - 1) / normalizer
+
+def _encode_games(df, entity_col):
+    '''
+    Sort all rows by (date, game_id) a single time and integer-code entities, so the
+    rating loop works on contiguous array slices instead of filtering df per game.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        entity_col : str or list
+            Column holding the rated entity, e.g. 'player' or 'corporation', or a list of
+            columns rated as one entity, e.g. ['player', 'corporation'].
+    Returns:
+        games : dict
+            codes (entity code per sorted row), entities (code -> name, or code -> row of
+            names for a list of columns), places, sizes,
+            starts (first row of each game), game_ids and game_dates (one per game),
+            order (positions of the sorted rows in df).
+    '''
+    if isinstance(entity_col, list):
+        codes, entities = pd.MultiIndex.from_arrays([df[col].values for col in entity_col]).factorize()
+        entities = np.array(list(entities), dtype=object).reshape(len(entities), len(entity_col))
+    else:
+        codes, entities = pd.factorize(df[entity_col])
+        entities = np.asarray(entities)
+    dates = pd.to_datetime(df['date'])
+    order = pd.DataFrame({'date': dates.values, 'game_id': df['game_id'].values})\
+        .sort_values(by=['date', 'game_id'], kind='mergesort').index.values
+
+    game_ids = df['game_id'].values[order]
+    starts = np.flatnonzero(np.r_[True, game_ids[1:] != game_ids[:-1]])
+    sizes = np.diff(np.append(starts, len(order)))
+
+    return {'codes': codes[order],
+            'order': order,
+            'entities': entities,
+            'places': df['place'].values[order].astype(float),
+            'sizes': np.repeat(sizes, sizes).astype(float),
+            'starts': starts,
+            'game_ids': game_ids[starts],
+            'game_dates': dates.values[order][starts],
+            'first_date': dates.min()}
+
+def _game_pairs(starts, n_rows):
+    '''
+    Row indices (i, j), i < j, of every pair of rows that shared a game, and the game of each pair.
+    '''
+    bounds = np.append(starts, n_rows)
+    pairs = [np.array(np.triu_indices(stop - start, k=1)) + start
+             for start, stop in zip(bounds[:-1], bounds[1:])]
+    game_of_pair = np.repeat(np.arange(len(starts)), [pair.shape[1] for pair in pairs])
+    pairs = np.concatenate(pairs, axis=1)
+    return pairs[0], pairs[1], game_of_pair
+
+def _elo_batch_pass(codes, starts, observed, ratings, include, k, d, return_pre=False, progress=None):
+    '''
+    Apply every game in order for a batch of C rating configurations at once, updating
+    ratings in place.
+
+    Each game's expected scores come from an n x n pairwise win-probability matrix (per
+    configuration), which is what expected_score() computes one player at a time.
+
+    Args:
+        codes : np.ndarray
+            Entity code per row, rows sorted by game
+        starts : np.ndarray
+            Index of the first row of each game
+        observed : np.ndarray
+            (C, rows) actual score per row, from _score_array()
+        ratings : np.ndarray
+            (C, entities) ratings before the first game. Updated in place.
+        include : np.ndarray
+            (C, games) whether each configuration rates each game
+        k : np.ndarray
+            (C,) K-factor per configuration
+        d : np.ndarray
+            (C,) rating scale per configuration
+        return_pre : bool
+            Also return each row's rating going into its game, e.g. to score predictions.
+        progress : callable
+            Called as progress(fraction of games done); may raise to stop the pass.
+    Returns:
+        post : np.ndarray
+            (C, rows) rating of each row's entity after its game; NaN where not included
+        pre : np.ndarray
+            (C, rows) rating of each row's entity before its game, only if return_pre
+    '''
+    post = np.full(observed.shape, np.nan)
+    pre = np.full(observed.shape, np.nan) if return_pre else None
+    bounds = np.append(starts, len(codes))
+    for g, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if progress is not None and g % PROGRESS_EVERY == 0:
+            progress(g / len(starts))
+        active = np.flatnonzero(include[:, g])
+        if len(active) == 0:
+            continue
+        game_codes = codes[start:stop]
+        n = stop - start
+        r = ratings[np.ix_(active, game_codes)]
+        # an entity is never its own opponent, even if it appears twice (e.g. UNKNOWN corps)
+        opponents = game_codes[:, None] != game_codes[None, :]
+        pairwise = 1 / (1 + 10**((r[:, None, :] - r[:, :, None]) / d[active, None, None]))
+        expected = np.sum(pairwise * opponents, axis=2) / (n*(n-1)/2)
+        updated = r + k[active, None]*(n-1)*(observed[active, start:stop] - expected)
+        ratings[np.ix_(active, game_codes)] = updated
+        post[active, start:stop] = updated
+        if return_pre:
+            pre[active, start:stop] = r
+    return (post, pre) if return_pre else post
+
+def _elo_pass(codes, starts, observed, ratings, k=32, d=400):
+    '''
+    Single-configuration _elo_batch_pass() over every game, updating ratings in place.
+
+    Returns:
+        post : np.ndarray
+            Rating of each row's entity after its game
+    '''
+    batch_ratings = ratings[None, :].copy()
+    post = _elo_batch_pass(codes, starts, observed[None, :], batch_ratings,
+                           include=np.ones((1, len(starts)), dtype=bool),
+                           k=np.array([k], dtype=float), d=np.array([d], dtype=float))
+    ratings[:] = batch_ratings[0]
+    return post[0]
+
+DEFAULT_CONFIG = {'score_fun': 'linear', 'subset': 'all', 'k': 32, 'd': 400, 'alpha': 2.}
+
+def config_key(config):
+    '''
+    Args:
+        config : dict
+            Any of the keys in DEFAULT_CONFIG; missing keys take their default.
+    Returns:
+        key : str
+            e.g. 'linear|all|k=32|d=400|alpha=2.0'
+    '''
+    config = {**DEFAULT_CONFIG, **config}
+    return f"{config['score_fun']}|{config['subset']}|k={config['k']}|d={config['d']}|alpha={float(config['alpha'])}"
+
+def _subset_mask(game_sizes, subset):
+    if subset == 'two-player':
+        return game_sizes == 2
+    elif subset == 'non-two-player':
+        return game_sizes != 2
+    assert subset == 'all', 'Not a valid game subset.'
+    return np.ones(len(game_sizes), dtype=bool)
+
+def compute_historical_ratings(df, entity_col='player', configs=(DEFAULT_CONFIG,), progress=None):
+    '''
+    Compute historical ratings for a batch of rating configurations in one pass over the games.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        entity_col : str or list
+            'player', 'corporation', or ['player', 'corporation'] to rate player+corporation pairs.
+        configs : list of dict
+            Rating configurations, each with any of the keys in DEFAULT_CONFIG:
+            score_fun ('linear' or 'exp'), subset ('all', 'two-player' or 'non-two-player'),
+            k, d and alpha.
+        progress : callable
+            Called as progress(fraction) while rating games; may raise (e.g. JobCancelled)
+            to stop early.
+    Returns:
+        ratings_df : pd.DataFrame
+            Long-format sparse event log with columns game_number, date, rating, the entity
+            column(s) and config (see config_key()). Within a config, each entity has a starting
+            row (rating 1000, the day before its config's first game), then one row per game it
+            actually played. Use forward_fill_ratings() for per-date values.
+    '''
+    configs = [{**DEFAULT_CONFIG, **config} for config in configs]
+    for config in configs:
+        assert config['score_fun'] in ['linear', 'exp'], 'Not a valid scoring function.'
+    entity_cols = entity_col if isinstance(entity_col, list) else [entity_col]
+
+    games = _encode_games(df, entity_col)
+    n_entities, n_games = len(games['entities']), len(games['starts'])
+    game_sizes = np.diff(np.append(games['starts'], len(games['codes'])))
+    game_of_row = np.repeat(np.arange(n_games), game_sizes)
+
+    observed = np.array([_score_array(games['places'], games['sizes'], config['score_fun'], alpha=config['alpha'])
+                         for config in configs])
+    include = np.array([_subset_mask(game_sizes, config['subset']) for config in configs])
+    post = _elo_batch_pass(games['codes'], games['starts'], observed, np.full((len(configs), n_entities), 1000.),
+                           include=include,
+                           k=np.array([config['k'] for config in configs], dtype=float),
+                           d=np.array([config['d'] for config in configs], dtype=float),
+                           progress=progress)
+
+    ratings_dfs = []
+    for c, config in enumerate(configs):
+        rows = include[c][game_of_row]
+        if not rows.any():
+            continue
+        codes = games['codes'][rows]
+        # entities ordered by first appearance in df, as if df had been filtered to this subset
+        first_seen = pd.Series(games['order'][rows]).groupby(codes).min().sort_values()
+        entity_codes = first_seen.index.values
+        rank = np.empty(n_entities, dtype=int)
+        rank[entity_codes] = np.arange(len(entity_codes))
+
+        game_numbers = np.cumsum(include[c]) + 1
+        start_date = np.datetime64(pd.Timestamp(games['game_dates'][include[c]].min()) - pd.Timedelta(days=1), 'ns')
+        config_df = pd.DataFrame({'game_number': np.r_[np.ones(len(entity_codes), dtype=int), game_numbers[game_of_row[rows]]],
+                                  'date': np.r_[np.repeat(start_date, len(entity_codes)), games['game_dates'][game_of_row[rows]]],
+                                  'rating': np.r_[np.full(len(entity_codes), 1000.), post[c, rows]],
+                                  'code': np.r_[entity_codes, codes]})
+        # an entity listed twice in one game (e.g. UNKNOWN corps) keeps its last update
+        config_df = config_df.drop_duplicates(subset=['code', 'game_number'], keep='last')
+        config_df = config_df.iloc[np.lexsort((config_df['game_number'].values, rank[config_df['code'].values]))]
+        entity_names = games['entities'][config_df['code'].values]
+        for i, col in enumerate(entity_cols):
+            config_df[col] = entity_names[:, i] if isinstance(entity_col, list) else entity_names
+        ratings_dfs.append(config_df.drop(columns='code').assign(config=config_key(config)))
+
+    return pd.concat(ratings_dfs).reset_index(drop=True)
+
+def compute_historical_player_ratings(df, score_fun, progress=None):
     '''
     Compute historical ratings for all players. 
 
@@ -62,53 +310,16 @@ def compute_historical_player_ratings(df, score_fun):
             All game data, i.e., terraforming-mars-stats.csv
         score_fun : str 
             Name of scoring function to use. Must be in ['linear','exp'].
+        progress : callable
+            See compute_historical_ratings()
     Returns:
         player_ratings_df : pd.DataFrame
     '''
-    assert(score_fun in ['linear', 'exp'], 'Not a valid scoring function.')
-    sf = {'linear': linear_score, 'exp': exp_score}[score_fun]
-    unique_sorted_game_ids = pd.Series([x for _,x in sorted(zip(df.date, df.game_id))]).unique()
-
-    player_ratings = {player: {1: {'date':(min(pd.to_datetime(df.date)) - pd.Timedelta(days=1)),
-                                'rating':1000}} for player in df.player.unique()}
-    current_ratings = {player: 1000 for player in df.player.unique()}
-    i = 2
-
-    for game_id in unique_sorted_game_ids:
-        game_df = df[df['game_id'] == game_id]
-        
-        new_ratings = {}
-        current_ratings_active_players = {player: rating for player, rating in current_ratings.items() if player in game_df.player.unique()}
-
-        for player, place, date in zip(game_df.player, game_df.place, game_df.date):
-            expected = expected_score(s=current_ratings_active_players, player=player, n=game_df.shape[0])
-            observed = sf(**{'p': place, 'n': game_df.shape[0]})
-            updated =  update_rating(current_rating=current_ratings_active_players[player], 
-                                    expected_score=expected, 
-                                    actual_score=observed, 
-                                    n=game_df.shape[0])
-            new_ratings[player] = {'previous': current_ratings_active_players[player],
-                                'expected': expected,
-                                'observed': observed,
-                                'updated_rating': updated}
-
-        for player in current_ratings.keys():
-                if player in new_ratings.keys(): # player played in current game
-                    current_ratings[player] = new_ratings[player]['updated_rating']
-                    player_ratings[player][i] = {'date': pd.to_datetime(date), 'rating': new_ratings[player]['updated_rating']}
-                else: # player did not play in current game
-                    player_ratings[player][i] = {'date': pd.to_datetime(date), 'rating': current_ratings[player]}
-        
-        i += 1
-        
-    player_rating_dfs_list = [pd.DataFrame(player_ratings[player]).T.reset_index().assign(player=player)\
-                            for player in player_ratings.keys()]
-    player_ratings_df = pd.concat(player_rating_dfs_list)
-    player_ratings_df.columns = ['game_number','date','rating','player']
-
-    return player_ratings_df
-
-def compute_historical_corp_ratings(df, score_fun='linear'):
+    assert score_fun in ['linear', 'exp'], 'Not a valid scoring function.'
+    return compute_historical_ratings(df, entity_col='player', configs=[{'score_fun': score_fun}],
+                                      progress=progress).drop(columns='config')
+
+def compute_historical_corp_ratings(df, score_fun='linear', progress=None):
     '''
     Compute historical ratings for all corporations. 
 
@@ -117,83 +328,342 @@ def compute_historical_corp_ratings(df, score_fun='linear'):
             All game data, i.e., terraforming-mars-stats.csv
         score_fun : str 
             Name of scoring function to use. Must be in ['linear','exp'].
+        progress : callable
+            See compute_historical_ratings()
     Returns:
         player_ratings_df : pd.DataFrame
     '''
-    assert(score_fun in ['linear', 'exp'], 'Not a valid scoring function.')
-    sf = {'linear': linear_score, 'exp': exp_score}[score_fun]
-    unique_sorted_game_ids = pd.Series([x for _,x in sorted(zip(df.date, df.game_id))]).unique()
-
-    corp_ratings = {corp: {1: {'date':(min(pd.to_datetime(df.date)) - pd.Timedelta(days=1)),
-                                'rating':1000}} for corp in df.corporation.unique()}
-    current_ratings = {corp: 1000 for corp in df.corporation.unique()}
-    i = 2
-
-    for game_id in unique_sorted_game_ids:
-        game_df = df[df['game_id'] == game_id]
-        
-        new_ratings = {}
-        current_ratings_active_corps = {corp: rating for corp, rating in current_ratings.items() if corp in game_df.corporation.unique()}
-
-        for corp, place, date in zip(game_df.corporation, game_df.place, game_df.date):
-            expected = expected_score(s=current_ratings_active_corps, player=corp, n=game_df.shape[0])
-            observed = linear_score(p=place, n=game_df.shape[0])
-            updated =  update_rating(current_rating=current_ratings_active_corps[corp], 
-                                    expected_score=expected, 
-                                    actual_score=observed, 
-                                    n=game_df.shape[0])
-            new_ratings[corp] = {'previous': current_ratings_active_corps[corp],
-                                'expected': expected,
-                                'observed': observed,
-                                'updated_rating': updated}
-
-        for corp in current_ratings.keys():
-                if corp in new_ratings.keys(): # corp played in current game
-                    current_ratings[corp] = new_ratings[corp]['updated_rating']
-                    corp_ratings[corp][i] = {'date': pd.to_datetime(date), 'rating': new_ratings[corp]['updated_rating']}
-                else: # corp did not play in current game
-                    corp_ratings[corp][i] = {'date': pd.to_datetime(date), 'rating': current_ratings[corp]}
-        
-        i += 1
-        
-    corp_rating_dfs_list = [pd.DataFrame(corp_ratings[corp]).T.reset_index().assign(corporation=corp)\
-                            for corp in corp_ratings.keys()]
-    corp_ratings_df = pd.concat(corp_rating_dfs_list)
-    corp_ratings_df.columns = ['game_number','date','rating','corporation']
-    corp_ratings_df['corporation_origin'] = corp_ratings_df['corporation'].map({corp: corp_origin for corp, corp_origin in set(zip(df.corporation, df.corporation_origin))})
+    assert score_fun in ['linear', 'exp'], 'Not a valid scoring function.'
+    corp_ratings_df = compute_historical_ratings(df, entity_col='corporation', configs=[{'score_fun': score_fun}],
+                                                 progress=progress).drop(columns='config')
+    return add_corporation_origin(corp_ratings_df, df)
 
+def add_corporation_origin(corp_ratings_df, df):
+    '''
+    Args:
+        corp_ratings_df : pd.DataFrame
+            Corporation ratings with a corporation column
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+    Returns:
+        corp_ratings_df : pd.DataFrame
+            With a corporation_origin column added
+    '''
+    corp_ratings_df['corporation_origin'] = corp_ratings_df['corporation'].map({corp: corp_origin for corp, corp_origin in set(zip(df.corporation, df.corporation_origin))})
     return corp_ratings_df
 
-def make_plotly_player_ts_ratings_plot(player_ratings_df):
+##############################################################################################################
+# rating checkpoints: current ratings plus enough bookkeeping to apply only newly appended games
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'terraforming-mars-stats-elo.json')
+
+def _game_hashes(df, entity_col, games):
+    '''
+    Fingerprint each game (in rating order) by the fields that affect ratings, so an edit to
+    an already-processed game can be detected without storing the game itself.
+    '''
+    order = games['order']
+    rows = pd.DataFrame({'game_id': df['game_id'].values[order].astype(str),
+                         'date': pd.to_datetime(df['date']).values[order],
+                         'entity': df[entity_col].values[order].astype(str),
+                         'place': df['place'].values[order].astype(float)})
+    row_hashes = pd.util.hash_pandas_object(rows, index=False).values
+    bounds = np.append(games['starts'], len(row_hashes))
+    return [hashlib.sha1(row_hashes[start:stop].tobytes()).hexdigest()[:16]
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def build_rating_state(df, entity_col='player', score_fun='linear', k=32, d=400, alpha=2.):
+    '''
+    Replay every game from a rating of 1000 and return a checkpoint of the result.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        entity_col : str
+            'player' or 'corporation'
+        score_fun : str
+            Name of scoring function to use. Must be in ['linear','exp'].
+        k, d, alpha : scoring parameters, see update_rating(), expected_score() and exp_score()
+    Returns:
+        state : dict
+    '''
+    assert score_fun in ['linear', 'exp'], 'Not a valid scoring function.'
+    state = {'entity_col': entity_col,
+             'params': {'score_fun': score_fun, 'k': k, 'd': d, 'alpha': alpha},
+             'ratings': {},
+             'last_date': None,
+             'last_game_id': None,
+             'game_hashes': []}
+    return update_ratings(state, df)
+
+def update_ratings(state, new_games_df):
+    '''
+    Apply the games in new_games_df that come after the checkpoint, i.e. only games appended
+    since the state was built. Games at or before the checkpoint are ignored, so passing the
+    full dataset is fine too.
+
+    Args:
+        state : dict
+            Output from build_rating_state() or a previous update_ratings()
+        new_games_df : pd.DataFrame
+            Game data in the terraforming-mars-stats.csv format
+    Returns:
+        state : dict
+            A new checkpoint; the input state is not modified.
+    '''
+    if state['last_date'] is not None:
+        dates = pd.to_datetime(new_games_df['date'])
+        last_date = pd.Timestamp(state['last_date'])
+        is_new = (dates > last_date) | ((dates == last_date) & (new_games_df['game_id'] > state['last_game_id']))
+        new_games_df = new_games_df[is_new.values]
+    if new_games_df.shape[0] == 0:
+        return state
+
+    entity_col, params = state['entity_col'], state['params']
+    games = _encode_games(new_games_df, entity_col)
+
+    ratings = dict(state['ratings'])
+    for entity in games['entities']:
+        ratings.setdefault(entity, 1000.)
+    entities = list(ratings.keys())
+    position = {entity: i for i, entity in enumerate(entities)}
+    codes = np.array([position[entity] for entity in games['entities']])[games['codes']]
+
+    current = np.array([ratings[entity] for entity in entities], dtype=float)
+    observed = _score_array(games['places'], games['sizes'], params['score_fun'], alpha=params['alpha'])
+    _elo_pass(codes, games['starts'], observed, current, k=params['k'], d=params['d'])
+
+    return {'entity_col': entity_col,
+            'params': dict(params),
+            'ratings': {entity: float(rating) for entity, rating in zip(entities, current)},
+            'last_date': pd.Timestamp(games['game_dates'][-1]).strftime('%Y-%m-%d'),
+            'last_game_id': games['game_ids'][-1:].tolist()[0],
+            'game_hashes': state['game_hashes'] + _game_hashes(new_games_df, entity_col, games)}
+
+def sync_rating_state(state, df):
+    '''
+    Bring a checkpoint up to date with the full dataset. Appended games are applied
+    incrementally; if any already-processed game was edited, removed or inserted before the
+    checkpoint, the state is rebuilt from scratch.
+
+    Args:
+        state : dict
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+    Returns:
+        state : dict
+    '''
+    games = _encode_games(df, state['entity_col'])
+    n_done = len(state['game_hashes'])
+    if n_done > len(games['starts']) or _game_hashes(df, state['entity_col'], games)[:n_done] != state['game_hashes']:
+        return build_rating_state(df, entity_col=state['entity_col'], **state['params'])
+    return update_ratings(state, df)
+
+def load_rating_states(path=CHECKPOINT_PATH):
+    '''
+    Returns:
+        states : dict
+            Checkpoints keyed by rating_state_key(); empty if no checkpoint file exists.
+    '''
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_rating_states(states, path=CHECKPOINT_PATH):
+    with open(path, 'w') as f:
+        json.dump(states, f, indent=1)
+
+def rating_state_key(entity_col, score_fun):
+    return f'{entity_col}-{score_fun}'
+
+##############################################################################################################
+# bootstrap intervals: B replicates of the whole rating history run side by side as one array dimension
+
+def bootstrap_current_ratings(df, entity_col='player', score_fun='linear', B=1000, method='permutation',
+                              ci=0.95, seed=0, k=32, d=400, alpha=2., progress=None):
+    '''
+    Confidence intervals for current ratings from B resampled rating histories.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        entity_col : str
+            'player' or 'corporation'
+        score_fun : str
+            Name of scoring function to use. Must be in ['linear','exp'].
+        B : int
+            # of replicates
+        method : str
+            'permutation' replays every game in a random order; 'bootstrap' resamples the set of
+            games with replacement and replays them in date order.
+        ci : float
+            Coverage of the interval, e.g. 0.95
+        seed : int
+        k, d, alpha : scoring parameters
+        progress : callable
+            Called as progress(fraction) while replaying games; may raise (e.g.
+            JobCancelled) to stop early.
+    Returns:
+        ci_df : pd.DataFrame
+            One row per entity with rating (from the actual game order), lower and upper
+    '''
+    assert score_fun in ['linear', 'exp'], 'Not a valid scoring function.'
+    assert method in ['permutation', 'bootstrap'], 'Not a valid resampling method.'
+    games = _encode_games(df, entity_col)
+    n_entities, n_games = len(games['entities']), len(games['starts'])
+    game_sizes = np.diff(np.append(games['starts'], len(games['codes'])))
+    observed = _score_array(games['places'], games['sizes'], score_fun, alpha=alpha)
+
+    # pad every game to the largest game size; padding points at a dummy entity column
+    max_size = game_sizes.max()
+    slot = np.arange(len(games['codes'])) - np.repeat(games['starts'], game_sizes)
+    game_of_row = np.repeat(np.arange(n_games), game_sizes)
+    padded_codes = np.full((n_games, max_size), n_entities)
+    padded_codes[game_of_row, slot] = games['codes']
+    padded_observed = np.zeros((n_games, max_size))
+    padded_observed[game_of_row, slot] = observed
+    valid = padded_codes < n_entities
+
+    rng = np.random.default_rng(seed)
+    if method == 'permutation':
+        samples = np.argsort(rng.random((B, n_games)), axis=1)
+    else:
+        samples = np.sort(rng.integers(0, n_games, size=(B, n_games)), axis=1)
+
+    ratings = np.full((B, n_entities + 1), 1000.)
+    played = np.zeros((B, n_entities + 1), dtype=bool)
+    replicate = np.arange(B)[:, None]
+    for t in range(n_games):
+        if progress is not None and t % PROGRESS_EVERY == 0:
+            progress(t / n_games)
+        g = samples[:, t]
+        codes, mask, n = padded_codes[g], valid[g], game_sizes[g][:, None]
+        r = ratings[replicate, codes]
+        opponents = mask[:, :, None] & mask[:, None, :] & (codes[:, :, None] != codes[:, None, :])
+        pairwise = 1 / (1 + 10**((r[:, None, :] - r[:, :, None]) / d))
+        expected = np.sum(pairwise * opponents, axis=2) / (n*(n-1)/2)
+        ratings[replicate, codes] = r + k*(n-1)*(padded_observed[g] - expected)
+        played[replicate, codes] = True
+
+    replicates = np.where(played, ratings, np.nan)[:, :n_entities]
+    tail = (1 - ci) / 2 * 100
+    lower, upper = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+
+    point = np.full(n_entities, 1000.)
+    _elo_pass(games['codes'], games['starts'], observed, point, k=k, d=d)
+    return pd.DataFrame({entity_col: games['entities'], 'rating': point, 'lower': lower, 'upper': upper})
+
+def current_ratings(ratings_df, entity_col='player'):
+    '''
+    Latest rating of every entity in a rating event log.
+
+    Args:
+        ratings_df : pd.DataFrame
+            Output from compute_historical_player_ratings() or compute_historical_corp_ratings()
+        entity_col : str
+            'player' or 'corporation'
+    Returns:
+        current_ratings_df : pd.DataFrame
+            One row per entity
+    '''
+    return ratings_df.sort_values(by='game_number', kind='mergesort')\
+        .drop_duplicates(subset=entity_col, keep='last')
+
+def forward_fill_ratings(ratings_df, entity_col='player', dates=None):
+    '''
+    Step-function view of a rating event log: every entity's rating as of each date, carrying
+    the last known rating forward over games the entity did not play.
+
+    Args:
+        ratings_df : pd.DataFrame
+            Output from compute_historical_player_ratings() or compute_historical_corp_ratings()
+        entity_col : str
+            'player' or 'corporation'
+        dates : array-like, optional
+            Dates to evaluate at. Defaults to every date in ratings_df.
+    Returns:
+        ffill_ratings_df : pd.DataFrame
+            One row per (date, entity) with columns date, rating, <entity_col>
+    '''
+    wide = ratings_df.sort_values(by='game_number', kind='mergesort')\
+        .drop_duplicates(subset=['date', entity_col], keep='last')\
+        .pivot(index='date', columns=entity_col, values='rating')
+    dates = wide.index if dates is None else pd.DatetimeIndex(pd.to_datetime(dates)).sort_values()
+    wide = wide.reindex(wide.index.union(dates)).ffill().reindex(dates).rename_axis('date')
+    ffill_ratings_df = wide.stack().rename('rating').reset_index()
+    return ffill_ratings_df[['date', 'rating', entity_col]]
+
+def _step_line_data(ratings_df, entity_col):
+    '''
+    Extend each entity's sparse rating history to the last date shown, so step lines run to
+    the right edge of the plot just like the old dense history did.
+    '''
+    last_points = current_ratings(ratings_df, entity_col).assign(date=ratings_df['date'].max())
+    return pd.concat([ratings_df, last_points]).sort_values(by=[entity_col, 'date'], kind='mergesort')
+
+def make_plotly_player_ts_ratings_plot(player_ratings_df, dates=None):
     '''
     Args:
         player_ratings_df : pd.Dataframe
             Output from compute_historical_player_ratings()
+        dates : array-like, optional
+            Plot per-date values from forward_fill_ratings() at these dates instead of
+            drawing the sparse history as step lines.
     Returns:
         fig : plotly object
     '''
+    if dates is not None:
+        return px.line(forward_fill_ratings(player_ratings_df, 'player', dates), x="date", y="rating", color='player')
 
     fig = px.line(
-        player_ratings_df
+        _step_line_data(player_ratings_df, 'player')
         , x="date"
         , y="rating"
-        , color='player')
+        , color='player'
+        , line_shape='hv')
     return fig
 
-def make_plotly_corp_ts_ratings_plot(corp_ratings_df, df):
+def make_plotly_corp_ts_ratings_plot(corp_ratings_df, df, dates=None):
     '''
     Args:
         corp_ratings_df : pd.Dataframe
             Output from compute_historical_corp_ratings()
         df : pd.DataFrame
             All game data, i.e., terraforming-mars-stats.csv. Needed to filter corps by expansion.
+        dates : array-like, optional
+            Plot per-date values from forward_fill_ratings() at these dates instead of
+            drawing the sparse history as step lines.
     Returns :
         fig : plotly object
     '''
+    if dates is not None:
+        return px.line(forward_fill_ratings(corp_ratings_df, 'corporation', dates), x="date", y="rating", color='corporation')
 
     fig = px.line(
-        corp_ratings_df
+        _step_line_data(corp_ratings_df, 'corporation')
         , x="date"
         , y="rating"
-        , color='corporation')
-    return fig
\ No newline at end of file
+        , color='corporation'
+        , line_shape='hv')
+    return fig
+
+def make_plotly_current_ratings_plot(ci_df, entity_col='player'):
+    '''
+    Args:
+        ci_df : pd.DataFrame
+            Output from bootstrap_current_ratings()
+        entity_col : str
+            'player' or 'corporation'
+    Returns:
+        fig : plotly object
+    '''
+    ci_df = ci_df.sort_values(by='rating', ascending=False)
+    fig = px.scatter(
+        ci_df
+        , x=entity_col
+        , y="rating"
+        , error_y=ci_df['upper'] - ci_df['rating']
+        , error_y_minus=ci_df['rating'] - ci_df['lower'])
+    return fig
@@ -1,11 +1,48 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import time
+import argparse
+import datetime
+import functools
+import hashlib
+import json
+import os
 import gspread  # https://docs.gspread.org/en/latest/oauth2.html#oauth-client-id
+from gspread.utils import numericise_all
+
+from tm_stats.elo import (
+    build_rating_state,
+    load_rating_states,
+    rating_state_key,
+    save_rating_states,
+    sync_rating_state,
+)
+from tm_stats.dataset import COLUMNAR_PATH, write_columnar
+from tm_stats.db import write_database
+from tm_stats.metrics import RunMetrics, save_report
+from tm_stats.sheets import SheetsFetcher
+from tm_stats.snapshots import has_snapshot, load_snapshot, save_snapshot
+from tm_stats.store import (
+    clear_game_store,
+    stored_partitions,
+    update_game_store,
+    write_game_store_csv,
+)
 
 ## note: if ever need to re-create and download oauth client secret,
 ## make sure to delete authorized_user.json file, which has token for login that needs to be removed ###
+## run from the repository root with: python -m tm_stats.etl
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "terraforming-mars-stats.csv",
+)
+MANIFEST_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "etl-manifest.json",
+)
+# bumped whenever stored games or manifest entries change meaning; 2 is content ids
+MANIFEST_VERSION = 2
 
 corp_map = {
     "Aphrodite": {"clean_name": "Aphrodite", "origin": "Venus"},
@@ -102,245 +139,777 @@ spreadsheets = [
 ]
 
 
-def format_data(sheet, spreadsheet):
+# categories that are section headers or not carried into the dataset
+dropped_categories = [
+    "Milestones (funder):",
+    "Awards (funder):",
+    "Map:",
+    "Generation",
+    "Credits (tiebreaker)",
+    "",
+]
+
+# columns produced per player by format_data(), besides player
+keep_columns = [
+    "game_id",
+    "sheet_id",
+    "date",
+    "num_players",
+    "board",
+    "prelude",
+    "venus",
+    "colonies",
+    "turmoil",
+    "bgg",
+    "corporation",
+    "corporation_origin",
+    "terraform_rating",
+    "num_greeneries",
+    "num_cities",
+    "num_colonies",
+    "num_greenery_adjacencies",
+    "card_points",
+    "award_1_name",
+    "award_1_funder",
+    "award_2_name",
+    "award_2_funder",
+    "award_3_name",
+    "award_3_funder",
+    "milestone_1_name",
+    "milestone_2_name",
+    "milestone_3_name",
+    "award_1_points",
+    "award_2_points",
+    "award_3_points",
+    "milestone_1_points",
+    "milestone_2_points",
+    "milestone_3_points",
+    "total_points",
+    "total_percent_of_points",
+    "point_diff",
+    "is_winner",
+    "place",
+]
+
+# rows every scored game has; worksheets without them (e.g. a blank template) are skipped
+score_categories = [
+    "Base TR Score",
+    "Greeneries",
+    "Cities (for ref, not points)",
+    "Greeneries adj to Cities",
+    "Points from Cards:",
+    "Total",
+]
+
+record_columns = [
+    "sheet_id",
+    "title",
+    "row",
+    "category",
+    "column",
+    "player",
+    "value",
+]
+
+# corp_map as arrays, looked up through pandas.Categorical codes
+corp_names = list(corp_map)
+corp_clean_names = np.array(
+    [corp_map[corp]["clean_name"] for corp in corp_names] + ["UNKNOWN"]
+)
+corp_origins = np.array([corp_map[corp]["origin"] for corp in corp_names] + ["UNKNOWN"])
+
+
+def sheet_id(spreadsheet, title):
     """
-    General function to clean and format Terraforming Mars data.
+    Key of the worksheet a game was read from, used to tie games back to the manifest.
     """
+    return hashlib.sha1(f"{str(spreadsheet)}_{title}".encode()).hexdigest()
 
-    df_t = pd.DataFrame(sheet.get_all_records())
-    df_t = df_t[
-        ~df_t["Category "].isin(
-            [
-                "Milestones (funder):",
-                "Awards (funder):",
-                "Map:",
-                "Generation",
-                "Credits (tiebreaker)",
-                "",
-            ]
-        )
+
+def content_game_id(date, title, players, total_points):
+    """
+    Stable game_id built from the game itself: the date, the worksheet title (board and
+    expansions) and each player's total. It does not depend on the spreadsheet, on other
+    games or on cleaning rules such as corp_map, so it survives re-runs of the ETL.
+
+    Returns:
+        game_id : str
+            e.g. "20220111-3f2a9c1b0d"; sorts by date
+    """
+    results = sorted(
+        (str(player), float(total)) for player, total in zip(players, total_points)
+    )
+    content = json.dumps([title, results])
+    return f"{date:%Y%m%d}-{hashlib.sha1(content.encode()).hexdigest()[:10]}"
+
+
+def sheet_records(values, title, spreadsheet):
+    """
+    Stage one of format_data(): reshape a worksheet's raw cell grid into long format,
+    one record per (category row, player column), with numeric strings converted the
+    way gspread's get_all_records() does.
+
+    Args:
+        values : list of list
+            The worksheet's cell grid, header row first.
+        title : str
+            Worksheet title, e.g. "2022-01-11 (Tharsis Venus Colonies)"
+        spreadsheet : str
+    Returns:
+        records : list of tuple
+            Fields as in record_columns
+    """
+    if not values:
+        return []
+    header, rows = values[0], values[1:]
+    players = header[1:]
+    game_sheet_id = sheet_id(spreadsheet, title)
+    records = []
+    for row_number, row in enumerate(rows):
+        row = numericise_all(row + [""] * (len(header) - len(row)))
+        category = row[0]
+        for column, (player, value) in enumerate(zip(players, row[1:])):
+            records.append(
+                (game_sheet_id, title, row_number, category, column, player, value)
+            )
+    return records
+
+
+def normalize_games(records):
+    """
+    Stage two of format_data(): clean a batch of games from their long-format records
+    in one pass.
+
+    Args:
+        records : iterable of tuple
+            Output from sheet_records(), for any number of worksheets
+    Returns:
+        df : pd.DataFrame
+            One row per player per game, game by game in record order
+    """
+    long_df = pd.DataFrame.from_records(list(records), columns=record_columns)
+    long_df = long_df[~long_df["category"].isin(dropped_categories)]
+    scored = (
+        long_df[long_df["category"].isin(score_categories)]
+        .groupby("sheet_id")["category"]
+        .nunique()
+    )
+    long_df = long_df[
+        long_df["sheet_id"].isin(scored.index[scored == len(score_categories)])
     ]
-    df = df_t.set_index("Category ").T
+    if long_df.shape[0] == 0:
+        return pd.DataFrame(columns=["player"] + keep_columns)
+    long_df["game"] = pd.factorize(long_df["sheet_id"])[0]
+    # award and milestone rows are found by position among the kept category rows
+    long_df["position"] = (
+        long_df.groupby("game")["row"].rank(method="dense").astype(int) - 1
+    )
+
+    long_df = long_df.drop_duplicates(["game", "column", "category"])
+    wide = long_df.pivot(index=["game", "column"], columns="category", values="value")
+    players = long_df.drop_duplicates(["game", "column"]).set_index(["game", "column"])[
+        "player"
+    ]
+    game = wide.index.get_level_values("game").values
 
     # metadata
-    date = str(sheet).split("'")[1].split("(")[0].strip()
-    df["game_id_temp"] = hash(f"{str(spreadsheet)}_{str(sheet)}")
-    df["date"] = pd.to_datetime(date)
-    df["num_players"] = df.shape[0]
-
-    if "(" in str(sheet) and ")" in str(sheet):
-        board_info = str(sheet).split("(")[1].replace(")", "").lower()
-        if "elys" in board_info:
-            df["board"] = "Elysium"
-        elif "hella" in board_info:
-            df["board"] = "Hellas"
-        elif "tharsis" in board_info:
-            df["board"] = "Tharsis"
-        else:
-            df["board"] = "Tharsis"
-        df["prelude"] = 1 if "prelude" in board_info else 0
-        df["venus"] = 1 if "ven" in board_info or " V " in board_info else 0
-        df["colonies"] = 1 if "col" in board_info else 0
-        df["turmoil"] = 1 if "turmoil" in board_info else 0
-        df["bgg"] = 1 if "bgg" in board_info else 0
-    else:
-        df["board"] = "Tharsis"
-        df["prelude"] = 0
-        df["venus"] = 0
-        df["colonies"] = 0
-        df["turmoil"] = 0
-        df["bgg"] = 0
+    games = long_df.drop_duplicates("game").set_index("game").sort_index()
+    titles = games["title"]
+    has_board_info = titles.str.contains("(", regex=False) & titles.str.contains(
+        ")", regex=False
+    )
+    # extract rather than split, whose .str[1] is all NaN (and not a string column)
+    # when no title in the batch has a "("
+    board_info = (
+        titles.str.extract(r"\(([^(]*)", expand=False)
+        .fillna("")
+        .str.replace(")", "", regex=False)
+        .str.lower()
+        .where(has_board_info, "")
+    )
+    boards = np.select(
+        [
+            board_info.str.contains("elys", regex=False),
+            board_info.str.contains("hella", regex=False),
+        ],
+        ["Elysium", "Hellas"],
+        "Tharsis",
+    )
+
+    df = pd.DataFrame(index=wide.index)
+    df["player"] = players.reindex(wide.index).values
+    dates = pd.to_datetime(titles.str.split("(").str[0].str.strip())
+    df["sheet_id"] = games["sheet_id"].values[game]
+    df["date"] = dates.values[game]
+    df["num_players"] = np.bincount(game)[game]
+    df["board"] = boards[game]
+    for flag, pattern in [
+        ("prelude", "prelude"),
+        ("venus", "ven| V "),
+        ("colonies", "col"),
+        ("turmoil", "turmoil"),
+        ("bgg", "bgg"),
+    ]:
+        df[flag] = board_info.str.contains(pattern).astype(int).values[game]
 
     # game play data
-    try:
-        df["corporation"] = df["Corp"].map(lambda x: corp_map[x]["clean_name"])
-        award_range = df.columns[2:5]
-        milestone_range = df.columns[5:8]
-    except:
-        df["corporation"] = "UNKNOWN"
-        award_range = df.columns[1:4]
-        milestone_range = df.columns[4:7]
-    try:
-        df["corporation_origin"] = df["Corp"].map(lambda x: corp_map[x]["origin"])
-    except:
-        df["corporation_origin"] = "UNKNOWN"
-
-    df["terraform_rating"] = df["Base TR Score"]
-    df["num_greeneries"] = df["Greeneries"]
-    df["num_cities"] = df["Cities (for ref, not points)"]
-    df["num_greenery_adjacencies"] = df["Greeneries adj to Cities"]
-    df["card_points"] = df["Points from Cards:"]
-    df["total_points"] = df["Total"]
-    try:
-        df["total_percent_of_points"] = df["%"]
-    except:
-        df["total_percent_of_points"] = df["Total"] / sum(df["Total"])
-    df["point_diff"] = max(df["Total"]) - df["Total"]
-    df["place"] = df["total_points"].rank(ascending=False)
+    corp_codes = pd.Categorical(
+        wide["Corp"] if "Corp" in wide else np.full(len(wide), np.nan),
+        categories=corp_names,
+    ).codes
+    # a game's corporations are only used if every one of them is known
+    has_corp = pd.Series(corp_codes >= 0).groupby(game).transform("all").values
+    corp_codes = np.where(has_corp, corp_codes, -1)
+    df["corporation"] = corp_clean_names[corp_codes]
+    df["corporation_origin"] = corp_origins[corp_codes]
 
-    try:
-        df["num_colonies"] = df["Colonies (reference)"]
-    except:
-        try:
-            df["num_colonies"] = df["Colonies (for ref, not scoring)"]
-        except:
-            df["num_colonies"] = 0
-    df["is_winner"] = [1 if total == max(df["Total"]) else 0 for total in df["Total"]]
-
-    for i, award_col in enumerate(award_range):
-        award_num = i + 1
-        award_name = award_col.split("(")[0]
-        try:
-            award_funder = award_col.split("(")[1].replace(")", "")
-        except:
-            award_funder = "UNKNOWN"
-        df[f"award_{award_num}_name"] = award_name
-        df[f"award_{award_num}_funder"] = award_funder
-        df[f"award_{award_num}_points"] = df[award_col]
-
-    for i, milestone_col in enumerate(milestone_range):
-        milestone_num = i + 1
-        milestone_name = milestone_col.split("(")[0]
-        # milestone_funder = milestone_col.split('(')[1].replace(')', '')
-        df[f"milestone_{milestone_num}_name"] = milestone_name
-        # df[f'milestone_{milestone_num}_funder'] = milestone_funder
-        df[f"milestone_{milestone_num}_points"] = df[milestone_col]
-
-    # keep good columns
-    keep_cols = [
-        "game_id_temp",
-        "date",
-        "num_players",
-        "board",
-        "prelude",
-        "venus",
-        "colonies",
-        "turmoil",
-        "bgg",
-        "corporation",
-        "corporation_origin",
-        "terraform_rating",
-        "num_greeneries",
-        "num_cities",
-        "num_colonies",
-        "num_greenery_adjacencies",
-        "card_points",
-        "award_1_name",
-        "award_1_funder",
-        "award_2_name",
-        "award_2_funder",
-        "award_3_name",
-        "award_3_funder",
-        "milestone_1_name",
-        "milestone_2_name",
-        "milestone_3_name",
-        "award_1_points",
-        "award_2_points",
-        "award_3_points",
-        "milestone_1_points",
-        "milestone_2_points",
-        "milestone_3_points",
-        "total_points",
-        "total_percent_of_points",
-        "point_diff",
-        "is_winner",
-        "place",
+    df["terraform_rating"] = wide["Base TR Score"]
+    df["num_greeneries"] = wide["Greeneries"]
+    df["num_cities"] = wide["Cities (for ref, not points)"]
+    df["num_greenery_adjacencies"] = wide["Greeneries adj to Cities"]
+    df["card_points"] = wide["Points from Cards:"]
+    df["total_points"] = wide["Total"]
+    total = pd.to_numeric(wide["Total"])
+    by_game = total.groupby(level="game")
+    max_total = by_game.transform("max")
+    percent = wide["%"] if "%" in wide else pd.Series(np.nan, index=wide.index)
+    df["total_percent_of_points"] = percent.where(
+        percent.notna(), total / by_game.transform("sum")
+    )
+    df["point_diff"] = max_total - total
+    df["place"] = by_game.rank(ascending=False)
+
+    df["num_colonies"] = 0
+    for colonies_col in ["Colonies (for ref, not scoring)", "Colonies (reference)"]:
+        if colonies_col in wide:
+            df["num_colonies"] = wide[colonies_col].where(
+                wide[colonies_col].notna(), df["num_colonies"]
+            )
+    df["is_winner"] = (total == max_total).astype(int)
+    game_ids = [
+        content_game_id(
+            dates.iloc[g], titles.iloc[g], game_df["player"], game_df["total"]
+        )
+        for g, game_df in pd.DataFrame(
+            {"player": df["player"].values, "total": total.values}, index=game
+        ).groupby(level=0)
     ]
+    df["game_id"] = np.array(game_ids, dtype=object)[game]
 
-    df = df[keep_cols]
-    df.reset_index(inplace=True)
-    df.rename(columns={"index": "player"}, inplace=True)
+    # without corporations the awards start one row earlier
+    offset = np.where(has_corp, 2, 1)
+    by_position = long_df.set_index(["game", "column", "position"])
+    for kind, first_position in [("award", 0), ("milestone", 3)]:
+        for i in range(3):
+            position = offset + first_position + i
+            cell = by_position.reindex(
+                pd.MultiIndex.from_arrays(
+                    [game, wide.index.get_level_values("column"), position]
+                )
+            )
+            name_parts = cell["category"].str.split("(")
+            df[f"{kind}_{i + 1}_name"] = name_parts.str[0].values
+            if kind == "award":
+                # all NaN, and so not a string column, if no award names a funder
+                df[f"award_{i + 1}_funder"] = (
+                    name_parts.str.get(1)
+                    .astype(object)
+                    .str.replace(")", "", regex=False)
+                    .fillna("UNKNOWN")
+                ).values
+            df[f"{kind}_{i + 1}_points"] = cell["value"].values
 
-    return df
+    df = df[["player"] + keep_columns]
+    return df.reset_index(drop=True)
 
 
-if __name__ == "__main__":
-    gc = gspread.oauth()
+def format_data(values, title, spreadsheet):
+    """
+    General function to clean and format Terraforming Mars data.
+
+    Args:
+        values : list of list
+            The worksheet's cell grid, header row first.
+        title : str
+            Worksheet title, e.g. "2022-01-11 (Tharsis Venus Colonies)"
+        spreadsheet : str
+    """
+    return normalize_games(sheet_records(values, title, spreadsheet))
+
+
+excluded_worksheets = [
+    "Round Robin - 10 Matches",
+    "2020-07-25 (Mini-Golf)",
+    "Copy of 2020-07-25 (Mini-Golf)",
+    "2020-08-?? (Mini-Golf)",
+]
+
+output_columns = [
+    "game_id",
+    "date",
+    "player",
+    "num_players",
+    "board",
+    "prelude",
+    "venus",
+    "colonies",
+    "turmoil",
+    "bgg",
+    "corporation",
+    "corporation_origin",
+    "terraform_rating",
+    "num_greeneries",
+    "num_cities",
+    "num_colonies",
+    "num_greenery_adjacencies",
+    "card_points",
+    "award_1_name",
+    "award_1_funder",
+    "award_2_name",
+    "award_2_funder",
+    "award_3_name",
+    "award_3_funder",
+    "milestone_1_name",
+    "milestone_2_name",
+    "milestone_3_name",
+    "award_1_points",
+    "award_2_points",
+    "award_3_points",
+    "milestone_1_points",
+    "milestone_2_points",
+    "milestone_3_points",
+    "total_points",
+    "total_percent_of_points",
+    "point_diff",
+    "is_winner",
+    "place",
+]
+
+
+def is_game_worksheet(title):
+    return not any(name in title for name in excluded_worksheets)
+
+
+def fetch_spreadsheet(fetcher, spreadsheet):
+    """
+    Fetch the cell grid of every game worksheet in a spreadsheet. This costs one open,
+    one worksheet listing and one batch read per 50 worksheets, instead of two calls per
+    worksheet.
+
+    Returns:
+        raw_sheets : list of dict
+            spreadsheet, title, values (cell grid), row_count and content_hash per
+            game, in worksheet order.
+    """
+    sh = fetcher.open(spreadsheet)
+    titles = [
+        sheet.title
+        for sheet in fetcher.worksheets(sh)
+        if is_game_worksheet(sheet.title)
+    ]
+    values = fetcher.batch_values(sh, titles)
+    print(f"Loop done for {spreadsheet} ({len(titles)} games)")
+    return [
+        {
+            "spreadsheet": spreadsheet,
+            "title": title,
+            "values": values[title],
+            "row_count": len(values[title]),
+            "content_hash": hashlib.sha1(
+                json.dumps(values[title]).encode()
+            ).hexdigest(),
+        }
+        for title in titles
+    ]
+
+
+def format_raw_sheets(raw_sheets):
+    """
+    Clean every fetched worksheet in one normalize_games() batch.
+
+    Returns:
+        df : pd.DataFrame
+    """
+    return normalize_games(
+        record
+        for raw_sheet in raw_sheets
+        for record in sheet_records(
+            raw_sheet["values"], raw_sheet["title"], raw_sheet["spreadsheet"]
+        )
+    )
+
 
-    df_dict = {}
-    i = 0
+def worksheet_key(spreadsheet, title):
+    return f"{spreadsheet}/{title}"
 
+
+def sheet_keys(raw_sheets):
+    """
+    Returns:
+        keys : dict
+            sheet_id() -> worksheet_key() of each raw sheet
+    """
+    return {
+        sheet_id(raw_sheet["spreadsheet"], raw_sheet["title"]): worksheet_key(
+            raw_sheet["spreadsheet"], raw_sheet["title"]
+        )
+        for raw_sheet in raw_sheets
+    }
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "spreadsheets": {}, "worksheets": {}}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Returns:
+        manifest : dict
+            version: MANIFEST_VERSION it was written with (missing before content ids)
+            spreadsheets: name -> modified_time and last_fetched
+            worksheets: "spreadsheet/title" -> spreadsheet, title, row_count,
+            content_hash, last_fetched and the game_id it produced, None if the
+            worksheet holds no game
+    """
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def utc_now():
+    return datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+# The ETL runs as a pipeline of generators, one spreadsheet at a time:
+#   fetch (iter_fetched_spreadsheets) -> format and normalize (iter_game_batches)
+#   -> write (write_game_batches)
+# so memory does not grow with the number of spreadsheets, and each spreadsheet's games
+# are stored and checkpointed in the manifest before the next one is processed.
+
+
+def iter_fetched_spreadsheets(fetcher, spreadsheets):
+    """
+    Fetch stage. Spreadsheets are fetched concurrently, but at most
+    fetcher.max_workers of them are held at once. Each is saved as a raw snapshot.
+
+    Yields:
+        spreadsheet : str
+        raw_sheets : list of dict
+            Output from fetch_spreadsheet()
+    """
+    for spreadsheet, raw_sheets in zip(
+        spreadsheets,
+        fetcher.imap(functools.partial(fetch_spreadsheet, fetcher), spreadsheets),
+    ):
+        fetcher.metrics.count("spreadsheets_fetched")
+        with fetcher.metrics.timer("snapshot_write"):
+            save_snapshot(spreadsheet, raw_sheets)
+        yield spreadsheet, raw_sheets
+
+
+def iter_snapshot_spreadsheets(spreadsheets):
+    """
+    Fetch stage for --replay, reading the raw snapshots instead of the Sheets API.
+    """
     for spreadsheet in spreadsheets:
-        if i > 0:
-            time.sleep(60)  # avoid API request limit
-        sh = gc.open(spreadsheet)
-        running = True
-        j = 0
-
-        while running:
-            try:
-                sheet = sh.get_worksheet(j)
-                if (
-                    "Round Robin - 10 Matches" not in str(sheet)
-                    and "2020-07-25 (Mini-Golf)" not in str(sheet)
-                    and "Copy of 2020-07-25 (Mini-Golf)" not in str(sheet)
-                    and "2020-08-?? (Mini-Golf)" not in str(sheet)
-                ):
-                    df_dict[i] = format_data(sheet, spreadsheet)
-                    j += 1
-                    i += 1
+        yield spreadsheet, load_snapshot(spreadsheet)
+
+
+def iter_game_batches(spreadsheet_batches, manifest, metrics=None):
+    """
+    Format and normalize stages. Only worksheets that are new or changed since the
+    manifest are cleaned.
+
+    Args:
+        spreadsheet_batches : iterable
+            Output from iter_fetched_spreadsheets() or iter_snapshot_spreadsheets()
+        manifest : dict
+        metrics : tm_stats.metrics.RunMetrics
+    Yields:
+        batch : dict
+            spreadsheet, raw_sheets, games_df (the cleaned new or changed games, with a
+            worksheet_key column), changed_keys (worksheets that were cleaned),
+            stale_game_ids (stored games they replace or that were deleted) and
+            removed_keys (deleted worksheets)
+    """
+    metrics = metrics or RunMetrics()
+    for spreadsheet, raw_sheets in spreadsheet_batches:
+        entries = {
+            key: entry
+            for key, entry in manifest["worksheets"].items()
+            if entry["spreadsheet"] == spreadsheet
+        }
+        keys = [
+            worksheet_key(raw_sheet["spreadsheet"], raw_sheet["title"])
+            for raw_sheet in raw_sheets
+        ]
+        changed = [
+            (key, raw_sheet)
+            for key, raw_sheet in zip(keys, raw_sheets)
+            if key not in entries
+            or entries[key]["content_hash"] != raw_sheet["content_hash"]
+        ]
+        removed_keys = [key for key in entries if key not in set(keys)]
+        stale_game_ids = [
+            entries[key]["game_id"]
+            for key in [key for key, _ in changed] + removed_keys
+            if key in entries and entries[key]["game_id"] is not None
+        ]
+
+        if changed:
+            changed_sheets = [raw_sheet for _, raw_sheet in changed]
+            with metrics.timer("format_data"):
+                games_df = format_raw_sheets(changed_sheets)
+            games_df["worksheet_key"] = games_df["sheet_id"].map(
+                sheet_keys(changed_sheets)
+            )
+        else:
+            games_df = pd.DataFrame(columns=output_columns + ["worksheet_key"])
+        metrics.count("worksheets_read", len(raw_sheets))
+        metrics.count("worksheets_skipped", len(raw_sheets) - len(changed))
+        metrics.count("worksheets_changed", len(changed))
+        metrics.count("worksheets_removed", len(removed_keys))
+        metrics.count("rows_produced", games_df.shape[0])
+        yield {
+            "spreadsheet": spreadsheet,
+            "raw_sheets": raw_sheets,
+            "games_df": games_df,
+            "changed_keys": [key for key, _ in changed],
+            "stale_game_ids": stale_game_ids,
+            "removed_keys": removed_keys,
+        }
+
+
+def write_game_batches(game_batches, manifest, modified_times, metrics=None):
+    """
+    Write stage. Each batch is applied to the game store, then the manifest is saved,
+    so an interrupted run picks up at the first spreadsheet that was not written.
+
+    Args:
+        game_batches : iterable
+            Output from iter_game_batches()
+        manifest : dict
+            Updated in place
+        modified_times : dict
+            Drive modifiedTime per spreadsheet, recorded in the manifest
+        metrics : tm_stats.metrics.RunMetrics
+    """
+    metrics = metrics or RunMetrics()
+    for batch in game_batches:
+        spreadsheet, games_df = batch["spreadsheet"], batch["games_df"]
+        with metrics.timer("store_write"):
+            touched = update_game_store(
+                games_df[output_columns], batch["stale_game_ids"]
+            )
+        metrics.count("partitions_written", len(touched))
+
+        now = utc_now()
+        game_ids = dict(zip(games_df["worksheet_key"], games_df["game_id"]))
+        changed_keys = set(batch["changed_keys"])
+        for raw_sheet in batch["raw_sheets"]:
+            key = worksheet_key(raw_sheet["spreadsheet"], raw_sheet["title"])
+            if key in changed_keys:
+                # None if the worksheet no longer holds a game
+                game_id = game_ids.get(key)
+            else:
+                game_id = manifest["worksheets"][key]["game_id"]
+            manifest["worksheets"][key] = {
+                "spreadsheet": raw_sheet["spreadsheet"],
+                "title": raw_sheet["title"],
+                "row_count": raw_sheet["row_count"],
+                "content_hash": raw_sheet["content_hash"],
+                "last_fetched": now,
+                "game_id": game_id,
+            }
+        for key in batch["removed_keys"]:
+            del manifest["worksheets"][key]
+        manifest["spreadsheets"][spreadsheet] = {
+            "modified_time": modified_times.get(spreadsheet),
+            "last_fetched": now,
+        }
+        save_manifest(manifest)
+        print(
+            f"{spreadsheet}: {games_df['worksheet_key'].nunique()} new or changed "
+            f"worksheets, {len(batch['removed_keys'])} removed"
+        )
+
+
+def write_outputs(metrics=None, sqlite=False):
+    """
+    Assemble terraforming-mars-stats.csv from the game store, then derive the columnar
+    copy, the Elo checkpoints and, if asked for, the SQLite copy from it.
+    """
+    metrics = metrics or RunMetrics()
+    with metrics.timer("csv_write"):
+        write_game_store_csv(DATA_PATH)
+        full_df = pd.read_csv(DATA_PATH, dtype={"game_id": str})
+    metrics.count("dataset_rows", full_df.shape[0])
+    try:
+        with metrics.timer("columnar_write"):
+            write_columnar(full_df)
+    except ImportError:
+        print(f"pyarrow is not installed, skipped {COLUMNAR_PATH}")
+    if sqlite:
+        with metrics.timer("sqlite_write"):
+            write_database(full_df)
+
+    # bring the Elo checkpoints up to date; appended games cost only their own Elo updates
+    with metrics.timer("elo_checkpoints"):
+        rating_states = load_rating_states()
+        for entity_col in ["player", "corporation"]:
+            for score_fun in ["linear", "exp"]:
+                key = rating_state_key(entity_col, score_fun)
+                if key in rating_states:
+                    rating_states[key] = sync_rating_state(rating_states[key], full_df)
                 else:
-                    j += 1
-            except gspread.exceptions.APIError:
-                time.sleep(
-                    60
-                )  # handle API limit for March-April Mars sheet, which is larger than the others
-            except:
-                running = False
-        print(f"Loop done for {spreadsheet}")
-
-full_df = pd.concat(df_dict.values())
-
-# create better game id
-unique_sorted_game_id_temp = pd.Series(
-    [x for _, x in sorted(zip(full_df.date, full_df.game_id_temp))]
-).unique()
-new_game_id_map = {
-    game_id_temp: i + 1 for i, game_id_temp in enumerate(unique_sorted_game_id_temp)
-}
-full_df["game_id"] = full_df["game_id_temp"].map(new_game_id_map)
-full_df.drop("game_id_temp", axis=1, inplace=True)
-full_df = full_df[
-    [
-        "game_id",
-        "date",
-        "player",
-        "num_players",
-        "board",
-        "prelude",
-        "venus",
-        "colonies",
-        "turmoil",
-        "bgg",
-        "corporation",
-        "corporation_origin",
-        "terraform_rating",
-        "num_greeneries",
-        "num_cities",
-        "num_colonies",
-        "num_greenery_adjacencies",
-        "card_points",
-        "award_1_name",
-        "award_1_funder",
-        "award_2_name",
-        "award_2_funder",
-        "award_3_name",
-        "award_3_funder",
-        "milestone_1_name",
-        "milestone_2_name",
-        "milestone_3_name",
-        "award_1_points",
-        "award_2_points",
-        "award_3_points",
-        "milestone_1_points",
-        "milestone_2_points",
-        "milestone_3_points",
-        "total_points",
-        "total_percent_of_points",
-        "point_diff",
-        "is_winner",
-        "place",
+                    rating_states[key] = build_rating_state(
+                        full_df, entity_col=entity_col, score_fun=score_fun
+                    )
+        save_rating_states(rating_states)
+
+
+def run_etl(
+    metrics,
+    client=None,
+    limiter=None,
+    max_workers=4,
+    full_refresh=False,
+    replay=False,
+    sqlite=False,
+):
+    """
+    See main().
+    """
+    manifest = load_manifest()
+    if replay:
+        metrics.info["mode"] = "replay"
+        # spreadsheets are re-recorded as they are replayed, so an interrupted replay
+        # leaves the rest to be fetched by the next run
+        modified_times = {
+            spreadsheet: entry["modified_time"]
+            for spreadsheet, entry in manifest["spreadsheets"].items()
+        }
+        manifest = empty_manifest()
+        clear_game_store()
+        write_game_batches(
+            iter_game_batches(
+                iter_snapshot_spreadsheets(spreadsheets), manifest, metrics
+            ),
+            manifest,
+            modified_times,
+            metrics,
+        )
+        write_outputs(metrics, sqlite)
+        return
+
+    fetcher = SheetsFetcher(
+        client or gspread.oauth(),
+        limiter=limiter,
+        max_workers=max_workers,
+        metrics=metrics,
+    )
+    # rebuild from scratch when asked, on the first run, or for a store written by an
+    # older version of the ETL
+    metrics.info["mode"] = "incremental"
+    if (
+        full_refresh
+        or not stored_partitions()
+        or manifest.get("version") != MANIFEST_VERSION
+    ):
+        metrics.info["mode"] = "full-refresh"
+        manifest = empty_manifest()
+        clear_game_store()
+
+    modified_times = fetcher.modified_times()
+    changed_spreadsheets = [
+        spreadsheet
+        for spreadsheet in spreadsheets
+        if spreadsheet not in manifest["spreadsheets"]
+        or not has_snapshot(spreadsheet)
+        or modified_times.get(spreadsheet)
+        != manifest["spreadsheets"][spreadsheet]["modified_time"]
     ]
-]
+    for spreadsheet in spreadsheets:
+        if spreadsheet not in changed_spreadsheets:
+            print(f"Skipping unchanged {spreadsheet}")
+    metrics.count("spreadsheets_skipped", len(spreadsheets) - len(changed_spreadsheets))
+
+    write_game_batches(
+        iter_game_batches(
+            iter_fetched_spreadsheets(fetcher, changed_spreadsheets), manifest, metrics
+        ),
+        manifest,
+        modified_times,
+        metrics,
+    )
+    write_outputs(metrics, sqlite)
 
-full_df.to_csv("../terraforming-mars-stats.csv", index=False)
+
+def main(
+    client=None,
+    limiter=None,
+    max_workers=4,
+    full_refresh=False,
+    replay=False,
+    sqlite=False,
+):
+    """
+    Run the ETL and write etl-run-report.json: API calls, bytes received, seconds spent
+    waiting on the rate limit, fetching, in format_data and writing, worksheets
+    skipped and rows produced.
+
+    Args:
+        client : gspread.Client
+            Defaults to an OAuth client; pass a fake to run against a local server.
+        limiter : tm_stats.sheets.SlidingWindowLimiter
+            Defaults to the Sheets read quota.
+        max_workers : int
+            # of concurrent API calls.
+        full_refresh : bool
+            Ignore the manifest and re-fetch every worksheet.
+        replay : bool
+            Rebuild from the raw snapshots in raw-sheets/ instead of the Sheets API.
+        sqlite : bool
+            Also write terraforming-mars-stats.sqlite for tm_stats.db.GameDatabase.
+    Returns:
+        report : dict
+    """
+    metrics = RunMetrics()
+    try:
+        run_etl(metrics, client, limiter, max_workers, full_refresh, replay, sqlite)
+        metrics.info["status"] = "ok"
+    except BaseException:
+        metrics.info["status"] = "failed"
+        raise
+    finally:
+        report = metrics.report()
+        save_report(report)
+        print(metrics.summary())
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="ignore etl-manifest.json and re-fetch every worksheet",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="rebuild from the raw snapshots in raw-sheets/ without network access",
+    )
+    parser.add_argument(
+        "--sqlite",
+        action="store_true",
+        help="also write terraforming-mars-stats.sqlite with indexed tables for the app",
+    )
+    args = parser.parse_args()
+    main(full_refresh=args.full_refresh, replay=args.replay, sqlite=args.sqlite)
@@ -0,0 +1,211 @@
+"""
+Head-to-head index between every pair of players (or corporations) that shared a game.
+
+Pairwise totals live in dense entity x entity arrays, so a lookup is two dict lookups
+and a handful of array reads regardless of how many games have been played.
+"""
+import numpy as np
+import pandas as pd
+
+from tm_stats.elo import (
+    _elo_batch_pass,
+    _encode_games,
+    _game_pairs,
+    _score_array,
+)
+
+_MATRICES = {
+    "games": np.int32,
+    "wins": np.int32,
+    "point_diff_sum": np.float64,
+    "rating_diff_sum": np.float64,
+}
+
+
+def _empty_index(entity_col, score_fun):
+    index = {
+        "entity_col": entity_col,
+        "score_fun": score_fun,
+        "entities": [],
+        "position": {},
+        "ratings": np.zeros(0),
+        "last_date": None,
+        "last_game_id": None,
+    }
+    for name, dtype in _MATRICES.items():
+        index[name] = np.zeros((0, 0), dtype=dtype)
+    return index
+
+
+def build_head_to_head(df, entity_col="player", score_fun="linear"):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        entity_col : str
+            'player' or 'corporation'
+        score_fun : str
+            Elo scoring function used for the rating differential
+    Returns:
+        index : dict
+    """
+    return update_head_to_head(_empty_index(entity_col, score_fun), df)
+
+
+def _is_new(index, games_df):
+    if index["last_date"] is None:
+        return np.ones(games_df.shape[0], dtype=bool)
+    dates = pd.to_datetime(games_df["date"])
+    last_date = pd.Timestamp(index["last_date"])
+    return (
+        (dates > last_date)
+        | ((dates == last_date) & (games_df["game_id"] > index["last_game_id"]))
+    ).values
+
+
+def _same_rows(a_df, b_df):
+    """
+    Whether two frames hold the same rows, in any order.
+    """
+    if a_df.shape != b_df.shape:
+        return False
+    # categoricals hash by value, so a new player added to the categories still matches
+    a_hashes = pd.util.hash_pandas_object(a_df, index=False).values
+    b_hashes = pd.util.hash_pandas_object(b_df, index=False).values
+    return np.array_equal(np.sort(a_hashes), np.sort(b_hashes))
+
+
+def refresh_head_to_head(index, indexed_df, df):
+    """
+    The index for df, given the index of an earlier version of the data. If df only adds
+    games after the last one in the index (the usual reload), just those are added with
+    update_head_to_head(); if anything else changed, it is rebuilt.
+
+    Args:
+        index : dict
+            Output from build_head_to_head(indexed_df, ...)
+        indexed_df : pd.DataFrame
+            The data index was built from
+        df : pd.DataFrame
+            The new data, with the same columns and dtypes
+    Returns:
+        index : dict
+    """
+    if (
+        list(df.columns) == list(indexed_df.columns)
+        # e.g. integer ids replaced by content ids, which do not compare
+        and df["game_id"].dtype == indexed_df["game_id"].dtype
+        and _same_rows(df[~_is_new(index, df)], indexed_df)
+    ):
+        return update_head_to_head(index, df)
+    return build_head_to_head(df, index["entity_col"], index["score_fun"])
+
+
+def update_head_to_head(index, new_games_df):
+    """
+    Add the games in new_games_df that come after the last game already in the index.
+    Games at or before it are ignored, so passing the full dataset is fine too.
+
+    Args:
+        index : dict
+            Output from build_head_to_head() or a previous update_head_to_head()
+        new_games_df : pd.DataFrame
+    Returns:
+        index : dict
+            A new index; the input index is not modified.
+    """
+    new_games_df = new_games_df[_is_new(index, new_games_df)]
+    if new_games_df.shape[0] == 0:
+        return index
+
+    entity_col = index["entity_col"]
+    games = _encode_games(new_games_df, entity_col)
+
+    # grow the arrays for entities seen for the first time
+    entities = list(index["entities"])
+    position = dict(index["position"])
+    for entity in games["entities"]:
+        if entity not in position:
+            position[entity] = len(entities)
+            entities.append(entity)
+    n_old, n_new = len(index["entities"]), len(entities)
+    updated = {
+        name: np.zeros((n_new, n_new), dtype=dtype) for name, dtype in _MATRICES.items()
+    }
+    for name in _MATRICES:
+        updated[name][:n_old, :n_old] = index[name]
+    ratings = np.r_[index["ratings"], np.full(n_new - n_old, 1000.0)]
+
+    codes = np.array([position[entity] for entity in games["entities"]])[games["codes"]]
+    observed = _score_array(games["places"], games["sizes"], index["score_fun"])
+    batch_ratings = ratings[None, :].copy()
+    _, pre = _elo_batch_pass(
+        codes,
+        games["starts"],
+        observed[None, :],
+        batch_ratings,
+        include=np.ones((1, len(games["starts"])), dtype=bool),
+        k=np.array([32.0]),
+        d=np.array([400.0]),
+        return_pre=True,
+    )
+
+    i, j, game_of_pair = _game_pairs(games["starts"], len(codes))
+    keep = codes[i] != codes[j]
+    i, j, game_of_pair = i[keep], j[keep], game_of_pair[keep]
+    a, b = codes[i], codes[j]
+    places = games["places"]
+    points = new_games_df["total_points"].values[games["order"]].astype(float)
+
+    # count a game once per pair even if an entity is listed twice in it (e.g. UNKNOWN corps)
+    _, first = np.unique(
+        np.c_[game_of_pair, np.minimum(a, b), np.maximum(a, b)],
+        axis=0,
+        return_index=True,
+    )
+    i, j, a, b = i[first], j[first], a[first], b[first]
+    np.add.at(updated["games"], (a, b), 1)
+    np.add.at(updated["games"], (b, a), 1)
+    np.add.at(updated["wins"], (a, b), places[i] < places[j])
+    np.add.at(updated["wins"], (b, a), places[j] < places[i])
+    np.add.at(updated["point_diff_sum"], (a, b), points[i] - points[j])
+    np.add.at(updated["point_diff_sum"], (b, a), points[j] - points[i])
+    np.add.at(updated["rating_diff_sum"], (a, b), pre[0, i] - pre[0, j])
+    np.add.at(updated["rating_diff_sum"], (b, a), pre[0, j] - pre[0, i])
+
+    return {
+        "entity_col": entity_col,
+        "score_fun": index["score_fun"],
+        "entities": entities,
+        "position": position,
+        "ratings": batch_ratings[0],
+        "last_date": pd.Timestamp(games["game_dates"][-1]).strftime("%Y-%m-%d"),
+        "last_game_id": games["game_ids"][-1:].tolist()[0],
+        **updated,
+    }
+
+
+def head_to_head(index, entity_a, entity_b):
+    """
+    Args:
+        index : dict
+            Output from build_head_to_head()
+        entity_a, entity_b : str
+    Returns:
+        record : dict
+            games together, wins of each over the other, mean point differential (a - b),
+            mean pre-game rating differential (a - b) and current rating differential (a - b).
+            None if either entity has never played.
+    """
+    a, b = index["position"].get(entity_a), index["position"].get(entity_b)
+    if a is None or b is None:
+        return None
+    games = int(index["games"][a, b])
+    return {
+        "games": games,
+        f"{entity_a} wins": int(index["wins"][a, b]),
+        f"{entity_b} wins": int(index["wins"][b, a]),
+        "mean_point_diff": index["point_diff_sum"][a, b] / games if games else np.nan,
+        "mean_rating_diff": index["rating_diff_sum"][a, b] / games if games else np.nan,
+        "current_rating_diff": index["ratings"][a] - index["ratings"][b],
+    }
@@ -0,0 +1,180 @@
+"""
+Card point distributions per (player, num_players), precomputed with NumPy.
+
+Card points are whole numbers, so each distribution is kept as exact counts on an
+integer grid shared by every player in games of the same size. A player's "field" is
+then the total counts minus their own, histograms are block sums of the grid, and an
+optional density curve is a Gaussian kernel convolved over the grid with an FFT, so
+none of it touches the game rows again after build_card_point_histograms().
+"""
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+def build_card_point_histograms(df):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+    Returns:
+        histograms : dict
+            num_players -> dict with start (card points of the first grid cell), total
+            (counts over every player) and players (player -> counts), counts being
+            np.ndarray with one cell per card point from start to the maximum
+    """
+    histograms = {}
+    # blank card points are left out, as a histogram of the column would
+    df = df[df["card_points"].notna()]
+    for num_players, size_df in df.groupby("num_players", sort=True):
+        card_points = size_df["card_points"].to_numpy(dtype=np.int64)
+        start = int(card_points.min())
+        length = int(card_points.max()) - start + 1
+        players = size_df["player"].astype(str).to_numpy()
+        histograms[num_players] = {
+            "start": start,
+            "total": np.bincount(card_points - start, minlength=length),
+            "players": {
+                player: np.bincount(
+                    card_points[players == player] - start, minlength=length
+                )
+                for player in np.unique(players)
+            },
+        }
+    return histograms
+
+
+def player_and_field_counts(histogram, player):
+    """
+    Returns:
+        player_counts, field_counts : np.ndarray
+            On the histogram's grid; the field is every other player in games of that
+            size, i.e. the total minus the player.
+    """
+    player_counts = histogram["players"].get(player)
+    if player_counts is None:
+        player_counts = np.zeros_like(histogram["total"])
+    return player_counts, histogram["total"] - player_counts
+
+
+def binned_density(counts, start, bin_size=5):
+    """
+    Histogram with probability density normalization, like histnorm="probability
+    density" in plotly.
+
+    Returns:
+        centers, density : np.ndarray
+    """
+    n_bins = -(-len(counts) // bin_size)
+    padded = np.zeros(n_bins * bin_size, dtype=counts.dtype)
+    padded[: len(counts)] = counts
+    bin_counts = padded.reshape(n_bins, bin_size).sum(axis=1)
+    centers = start + bin_size * np.arange(n_bins) + (bin_size - 1) / 2
+    total = counts.sum()
+    if total == 0:
+        return centers, np.zeros(n_bins)
+    return centers, bin_counts / (total * bin_size)
+
+
+def kde_density(counts, start, bandwidth=None, padding=3.0):
+    """
+    Gaussian kernel density estimate evaluated on the integer grid, computed as an FFT
+    convolution of the counts with the kernel.
+
+    Args:
+        counts : np.ndarray
+        start : int
+        bandwidth : float
+            In card points; defaults to Scott's rule, like scipy's gaussian_kde.
+        padding : float
+            Bandwidths of grid added on both sides, so the tails are not cut off.
+    Returns:
+        x, density : np.ndarray
+    """
+    total = counts.sum()
+    grid = start + np.arange(len(counts))
+    if total == 0:
+        return grid, np.zeros(len(counts))
+    if bandwidth is None:
+        mean = (grid * counts).sum() / total
+        std = np.sqrt(((grid - mean) ** 2 * counts).sum() / max(total - 1, 1))
+        bandwidth = max(std, 1.0) * total ** (-1 / 5)
+
+    pad = int(np.ceil(padding * bandwidth))
+    padded = np.concatenate([np.zeros(pad), counts, np.zeros(pad)])
+    offsets = np.arange(-pad, pad + 1)
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+
+    size = 1 << int(np.ceil(np.log2(len(padded) + len(kernel) - 1)))
+    smoothed = np.fft.irfft(np.fft.rfft(padded, size) * np.fft.rfft(kernel, size), size)
+    density = np.clip(smoothed[pad : pad + len(padded)], 0, None) / total
+    return np.arange(start - pad, start - pad + len(padded)), density
+
+
+def make_plotly_card_points_plot(histograms, player, kde=False, bin_size=5):
+    """
+    One subplot per game size with the player's card points against the field's.
+
+    Args:
+        histograms : dict
+            From build_card_point_histograms()
+        player : str
+        kde : bool
+            Overlay kde_density() curves on the histograms.
+        bin_size : int
+    Returns:
+        fig : go.Figure
+    """
+    num_players = sorted(histograms)
+    fig = make_subplots(
+        rows=1,
+        cols=len(num_players),
+        subplot_titles=[f"{n}-player" for n in num_players],
+    )
+
+    for i, n in enumerate(num_players):
+        histogram = histograms[n]
+        counts = player_and_field_counts(histogram, player)
+        for group_label, color, group_counts in zip(
+            [player, "Field"], ["blue", "grey"], counts
+        ):
+            centers, density = binned_density(
+                group_counts, histogram["start"], bin_size
+            )
+            fig.add_trace(
+                go.Bar(
+                    x=centers,
+                    y=density,
+                    name=group_label,
+                    legendgroup=group_label,
+                    marker_color=color,
+                    opacity=0.7,
+                    showlegend=i == 0,
+                ),
+                row=1,
+                col=i + 1,
+            )
+            if kde:
+                x, density = kde_density(group_counts, histogram["start"])
+                fig.add_trace(
+                    go.Scatter(
+                        x=x,
+                        y=density,
+                        mode="lines",
+                        line=dict(color=color, width=0.5),
+                        legendgroup=group_label,
+                        showlegend=False,
+                    ),
+                    row=1,
+                    col=i + 1,
+                )
+
+    fig.update_layout(
+        title_text=f"Points from Cards: {player} vs. Field",
+        title_x=0.5,
+        plot_bgcolor="rgba(0,0,0,0)",
+        bargap=0,
+    )
+    fig.update_yaxes(showticklabels=False)
+    return fig
@@ -0,0 +1,160 @@
+"""
+Local background job queue for slow dashboard callbacks.
+
+Jobs run on a thread pool inside the web worker that received them. Their status and
+result are kept on local disk, so any gunicorn worker can answer a poll for any job and
+no external broker is needed.
+"""
+import glob
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when a newer job was submitted to the same slot or it was cancelled.
+    """
+
+
+def stage_progress(progress, start, stop, message=""):
+    """
+    Progress callback for one stage of a job, e.g. a long computation that reports its own
+    fraction done (0 to 1) and is mapped onto start to stop of the whole job.
+
+    Returns:
+        stage_progress : callable
+            stage_progress(fraction, message=message), raising JobCancelled like progress
+    """
+
+    def report(fraction, stage_message=""):
+        progress(start + (stop - start) * fraction, stage_message or message)
+
+    return report
+
+
+class JobQueue:
+    """
+    Args:
+        root : str
+            Directory for job status and result files.
+        max_workers : int
+            # of jobs that run at once in this process.
+        max_age : float
+            Seconds after which finished job files are removed.
+    """
+
+    def __init__(self, root=None, max_workers=2, max_age=3600):
+        self.root = root or os.path.join(tempfile.gettempdir(), "tm-stats-jobs")
+        self.max_age = max_age
+        os.makedirs(self.root, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _write_json(self, name, data):
+        # write then rename so readers in other processes never see a partial file
+        tmp_path = self._path(f"{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _read_json(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _set_status(self, job_id, **status):
+        self._write_json(f"{job_id}.json", status)
+
+    def submit(self, slot, fn, *args, **kwargs):
+        """
+        Queue fn(*args, progress=..., **kwargs) and supersede any earlier job in slot.
+
+        fn should call progress(fraction, message) now and then; the call raises
+        JobCancelled once the job has been superseded, which stops it early.
+
+        Args:
+            slot : str
+                e.g. f"{session_id}-player-elo"; at most one job per slot is current.
+            fn : callable
+        Returns:
+            job_id : str
+        """
+        self._cleanup()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            previous = self._read_json(f"slot-{slot}.json")
+            self._write_json(f"slot-{slot}.json", {"job_id": job_id})
+        if previous is not None:
+            self.cancel(previous["job_id"])
+        self._set_status(job_id, state="queued", progress=0.0, message="Queued")
+        self._pool.submit(self._run, job_id, slot, fn, args, kwargs)
+        return job_id
+
+    def _is_current(self, job_id, slot):
+        current = self._read_json(f"slot-{slot}.json")
+        status = self._read_json(f"{job_id}.json")
+        return (
+            current is not None
+            and current["job_id"] == job_id
+            and (status is None or status["state"] != "cancelled")
+        )
+
+    def _run(self, job_id, slot, fn, args, kwargs):
+        def progress(fraction, message=""):
+            if not self._is_current(job_id, slot):
+                raise JobCancelled(job_id)
+            self._set_status(job_id, state="running", progress=fraction, message=message)
+
+        try:
+            progress(0.0, "Starting")
+            result = fn(*args, progress=progress, **kwargs)
+            if not self._is_current(job_id, slot):
+                raise JobCancelled(job_id)
+            with open(self._path(f"{job_id}.pkl"), "wb") as f:
+                pickle.dump(result, f)
+            self._set_status(job_id, state="done", progress=1.0, message="Done")
+        except JobCancelled:
+            self._set_status(job_id, state="cancelled", progress=0.0, message="Cancelled")
+        except Exception:
+            self._set_status(
+                job_id, state="failed", progress=0.0, message=traceback.format_exc()
+            )
+
+    def status(self, job_id):
+        """
+        Returns:
+            status : dict
+                state ('queued', 'running', 'done', 'failed' or 'cancelled'), progress
+                (0 to 1) and message. None for an unknown job.
+        """
+        return self._read_json(f"{job_id}.json")
+
+    def result(self, job_id):
+        with open(self._path(f"{job_id}.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def cancel(self, job_id):
+        status = self.status(job_id)
+        if status is not None and status["state"] in ["queued", "running"]:
+            self._set_status(job_id, state="cancelled", progress=0.0, message="Cancelled")
+
+    def _cleanup(self):
+        cutoff = time.time() - self.max_age
+        for path in glob.glob(self._path("*")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,80 @@
+"""
+Counters and timers for one ETL run, written out as a JSON run report.
+Timers add up time spent in every thread, so with concurrent fetching e.g. fetch_seconds
+can exceed the wall-clock duration of the run.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+RUN_REPORT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "etl-run-report.json",
+)
+
+
+class RunMetrics:
+    def __init__(self):
+        self.info = {}
+        self.counters = {}
+        self.seconds = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def report(self):
+        """
+        Returns:
+            report : dict
+                started, wall_seconds, info (e.g. run mode and status), counters and
+                seconds (per timer)
+        """
+        with self._lock:
+            return {
+                "started": time.strftime(
+                    "%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._started)
+                ),
+                "wall_seconds": round(time.time() - self._started, 3),
+                **self.info,
+                "counters": dict(sorted(self.counters.items())),
+                "seconds": {
+                    name: round(seconds, 3)
+                    for name, seconds in sorted(self.seconds.items())
+                },
+            }
+
+    def summary(self):
+        """
+        One line per section, e.g. for the end of the ETL's console output.
+        """
+        report = self.report()
+        info = " ".join(f"{name}={value}" for name, value in self.info.items())
+        counters = ", ".join(f"{name}={n}" for name, n in report["counters"].items())
+        seconds = ", ".join(f"{name}={s:.2f}" for name, s in report["seconds"].items())
+        return (
+            f"ETL run took {report['wall_seconds']:.1f}s ({info})\n"
+            f"  counts: {counters}\n"
+            f"  seconds: {seconds}"
+        )
+
+
+def save_report(report, path=RUN_REPORT_PATH):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
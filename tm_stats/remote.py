@@ -0,0 +1,181 @@
+"""
+Local-first access to the published terraforming-mars-stats.csv.
+
+The app boots from a file on local disk, either the CSV (or its columnar copy) deployed
+with the code or the last copy downloaded from upstream, so starting a worker never waits
+on the network. A background thread then keeps the downloaded copy fresh with
+conditional requests: the ETag and Last-Modified of the last download are sent back, and
+an unchanged file costs one 304 response.
+"""
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import pandas as pd
+import requests
+
+from tm_stats.dataset import COLUMNAR_PATH, load_dataset
+
+DATA_URL = "https://raw.githubusercontent.com/AnthonyRentsch/terraforming-mars-stats/main/terraforming-mars-stats.csv"
+
+BUNDLED_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "terraforming-mars-stats.csv",
+)
+
+
+class DatasetMirror:
+    """
+    Args:
+        url : str
+            Upstream CSV, e.g. a local HTTP server in tests.
+        root : str
+            Directory for the downloaded copy and its validators.
+        bundled_path : str
+            CSV deployed with the app, used until something newer is downloaded.
+        columnar_path : str
+            Columnar copy of bundled_path.
+        timeout : float
+            Seconds per request.
+    """
+
+    def __init__(
+        self,
+        url=DATA_URL,
+        root=None,
+        bundled_path=BUNDLED_PATH,
+        columnar_path=COLUMNAR_PATH,
+        timeout=10,
+    ):
+        self.url = url
+        self.root = root or os.path.join(tempfile.gettempdir(), "tm-stats-data")
+        self.bundled_path = bundled_path
+        self.columnar_path = columnar_path
+        self.timeout = timeout
+        self.path = os.path.join(self.root, "terraforming-mars-stats.csv")
+        self.meta_path = os.path.join(self.root, "terraforming-mars-stats.json")
+        self.loaded = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def _mtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def local_path(self):
+        """
+        The downloaded copy if it is newer than the bundled CSV, else the bundled CSV.
+        """
+        downloaded, bundled = self._mtime(self.path), self._mtime(self.bundled_path)
+        if downloaded is not None and (bundled is None or downloaded > bundled):
+            return self.path
+        return self.bundled_path
+
+    def load(self):
+        """
+        Returns:
+            df : pd.DataFrame
+                From local disk only, see tm_stats.dataset.load_dataset()
+        """
+        path = self.local_path()
+        self.loaded = (path, self._mtime(path))
+        if path == self.path:
+            return load_dataset(path, columnar_path=None)
+        return load_dataset(path, columnar_path=self.columnar_path)
+
+    def has_update(self):
+        """
+        Whether local disk has a newer copy than the last load(), whoever downloaded it
+        (workers share the downloaded copy, so only one of them gets the 200).
+        """
+        path = self.local_path()
+        return self.loaded != (path, self._mtime(path))
+
+    def _read_meta(self):
+        if not os.path.exists(self.path):
+            # validators without the file they describe would make a 304 useless
+            return {}
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def refresh(self):
+        """
+        Make one conditional request for the upstream CSV.
+
+        Returns:
+            changed : bool
+                True if a new copy was downloaded, False on a 304.
+        """
+        meta = self._read_meta()
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = requests.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        # never replace a good copy with something that is not the dataset
+        columns = pd.read_csv(io.BytesIO(response.content), nrows=0).columns
+        if "game_id" not in columns or "player" not in columns:
+            raise ValueError(f"{self.url} did not return terraforming-mars-stats.csv")
+
+        self._write_atomic(self.path, response.content)
+        self._write_atomic(
+            self.meta_path,
+            json.dumps(
+                {
+                    "url": self.url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched": time.time(),
+                }
+            ).encode(),
+        )
+        return True
+
+    def start(self, interval=600, on_change=None):
+        """
+        Call refresh() now and then every interval seconds on a daemon thread. Failures
+        are printed and retried at the next interval.
+
+        Args:
+            interval : float
+            on_change : callable
+                Called with no arguments when has_update(), e.g. to load() the new copy.
+        Returns:
+            thread : threading.Thread
+        """
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Refreshing the dataset from {self.url} failed: {e!r}")
+                if on_change is not None and self.has_update():
+                    try:
+                        on_change()
+                    except Exception as e:
+                        print(f"Reloading the dataset failed: {e!r}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="dataset-refresh", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,108 @@
+"""
+Row positions of every game and player, found once per dataset version for the
+aggregates in tm_stats.aggregates.
+
+The frame is kept sorted by game (see sort_by_game()), so each game is one contiguous
+slice of rows, and players are grouped with a single stable argsort: one array of row
+positions ordered by player, plus the offset where each player's positions start. A
+lookup is then a dict access and a slice, so its cost grows with the player's rows
+instead of with the dataset, where df[df.player == player] reads every row.
+"""
+import numpy as np
+import pandas as pd
+
+
+def sort_by_game(df):
+    """
+    Args:
+        df : pd.DataFrame
+            All game data, most recent game first
+    Returns:
+        df : pd.DataFrame
+            The same rows with each game's rows next to each other, games in order of
+            first appearance and players in their original order within a game; df
+            itself if that already holds, as it does for ETL output.
+    """
+    codes, uniques = pd.factorize(df["game_id"])
+    if np.count_nonzero(np.diff(codes)) + 1 == len(uniques) or df.shape[0] == 0:
+        return df
+    return df.take(np.argsort(codes, kind="mergesort")).reset_index(drop=True)
+
+
+def _group_offsets(values):
+    """
+    Returns:
+        lookup : dict
+            value -> group number
+        order : np.ndarray of int
+            Row positions grouped by value, ascending within a group; rows with missing
+            values are left out
+        offsets : np.ndarray of int
+            Group k is order[offsets[k]:offsets[k + 1]]
+    """
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind="mergesort")
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # missing values are coded -1, so they sort first
+    order = order[len(codes) - counts.sum() :]
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return {str(value): k for k, value in enumerate(uniques)}, order, offsets
+
+
+class RowIndex:
+    """
+    Args:
+        df : pd.DataFrame
+            Sorted by game, see sort_by_game(); lookups return rows of this frame
+        columns : list of str
+            Entity columns to group rows by, besides game_id
+    """
+
+    def __init__(self, df, columns=("player",)):
+        self.df = df
+        game_ids = df["game_id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, game_ids[1:] != game_ids[:-1]])
+        stops = np.r_[starts[1:], len(game_ids)].astype(int)
+        self.game_slices = {
+            game_id: slice(int(start), int(stop))
+            for game_id, start, stop in zip(game_ids[starts], starts, stops)
+        }
+        if len(self.game_slices) != len(starts):
+            raise ValueError("df is not sorted by game, see sort_by_game()")
+        self._groups = {column: _group_offsets(df[column]) for column in columns}
+
+    def values(self, column):
+        """
+        Returns:
+            values : list of str
+                Every value of column that has rows, in order of first appearance
+        """
+        return list(self._groups[column][0])
+
+    def positions(self, column, value):
+        """
+        Returns:
+            positions : np.ndarray of int
+                Row positions where column equals value, in frame order. A view into
+                the index, so it must not be modified.
+        """
+        lookup, order, offsets = self._groups[column]
+        group = lookup.get(value)
+        if group is None:
+            return order[:0]
+        return order[offsets[group] : offsets[group + 1]]
+
+    def games_rows(self, game_ids):
+        """
+        Returns:
+            games_df : pd.DataFrame
+                Rows of several games, in the order given; copies only those rows.
+        """
+        game_slices = [self.game_slices[game_id] for game_id in game_ids]
+        if len(game_slices) == 1:
+            return self.df.iloc[game_slices[0]]
+        return self.df.take(
+            np.concatenate(
+                [np.arange(s.start, s.stop) for s in game_slices] + [np.arange(0)]
+            )
+        )
@@ -0,0 +1,230 @@
+"""
+Rate-limited, concurrent access to the Google Sheets API for the ETL.
+Every API call goes through one sliding-window limiter sized to the Sheets read quota,
+and rate-limited or server-side failures are retried with jittered exponential
+backoff. The client is passed in, so anything with gspread's Client/Spreadsheet/
+Worksheet interface (e.g. a fake backed by a local server) can stand in for Google.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
+
+from tm_stats.metrics import RunMetrics
+
+# Sheets API default quota: 60 read requests per minute per user
+QUOTA_REQUESTS = 60
+QUOTA_PERIOD = 60.0
+
+
+class SlidingWindowLimiter:
+    """
+    Allows at most max_requests calls in any period seconds, which is how the Sheets
+    quota counts them; a token bucket that starts full lets through its whole capacity
+    plus everything refilled during the first period.
+
+    Args:
+        max_requests : int
+        period : float
+            Seconds.
+    """
+
+    def __init__(self, max_requests=QUOTA_REQUESTS, period=QUOTA_PERIOD):
+        self.max_requests = max_requests
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, calls=1):
+        """
+        Block until calls more calls fit in the window.
+
+        Returns:
+            waited : float
+                Seconds spent waiting on the rate limit.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and self._calls[0] <= now - self.period:
+                    self._calls.popleft()
+                if len(self._calls) + calls <= self.max_requests:
+                    self._calls.extend([now] * calls)
+                    return waited
+                # wait until enough of the oldest calls have left the window
+                expires = self._calls[len(self._calls) + calls - self.max_requests - 1]
+                delay = expires + self.period - now
+            time.sleep(delay)
+            waited += delay
+
+
+def is_transient(error):
+    """
+    Returns:
+        transient : bool
+            Whether a failed call is worth retrying: rate limited (429) or a server error
+            (5xx). Bad requests, missing permissions and unknown spreadsheets (400, 403,
+            404) fail the same way every time.
+    """
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def with_backoff(
+    fn,
+    retry_on,
+    max_retries=6,
+    base_delay=1.0,
+    max_delay=64.0,
+    on_retry=None,
+    retry_if=None,
+):
+    """
+    Call fn(), retrying on retry_on exceptions with full-jitter exponential backoff.
+
+    Args:
+        fn : callable
+        retry_on : tuple of Exception types
+        retry_if : callable
+            Called with a retry_on exception; it is raised right away if this returns
+            False.
+        max_retries : int
+        base_delay, max_delay : float
+            Seconds; attempt i waits uniform(0, min(max_delay, base_delay * 2**i)).
+        on_retry : callable
+            Called with the delay in seconds before each retry.
+    Returns:
+        fn()
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except retry_on as error:
+            if attempt == max_retries or (retry_if is not None and not retry_if(error)):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            if on_retry is not None:
+                on_retry(delay)
+            time.sleep(delay)
+
+
+def _payload_bytes(result):
+    # size of the decoded JSON payload; gspread does not expose the raw response here
+    try:
+        return len(json.dumps(result).encode())
+    except TypeError:
+        return 0
+
+
+class SheetsFetcher:
+    """
+    Args:
+        client : gspread.Client
+            Or anything with the same open()/worksheets() interface.
+        limiter : SlidingWindowLimiter
+            Shared by every call made through this fetcher.
+        max_workers : int
+            # of API calls in flight at once.
+        retry_on : tuple of Exception types
+            Retried only when is_transient(), i.e. for 429 and 5xx responses.
+        metrics : tm_stats.metrics.RunMetrics
+            Receives api_calls, api_retries and bytes_received counts and
+            rate_limit_wait, backoff_sleep and fetch seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        limiter=None,
+        max_workers=4,
+        retry_on=(gspread.exceptions.APIError,),
+        metrics=None,
+    ):
+        self.client = client
+        self.limiter = limiter or SlidingWindowLimiter()
+        self.max_workers = max_workers
+        self.retry_on = retry_on
+        self.metrics = metrics or RunMetrics()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Make one rate-limited API call, i.e. fn must issue exactly one request.
+        """
+
+        def attempt():
+            self.metrics.add_time("rate_limit_wait", self.limiter.acquire())
+            self.metrics.count("api_calls")
+            with self.metrics.timer("fetch"):
+                result = fn(*args, **kwargs)
+            self.metrics.count("bytes_received", _payload_bytes(result))
+            return result
+
+        def on_retry(delay):
+            self.metrics.count("api_retries")
+            self.metrics.add_time("backoff_sleep", delay)
+
+        return with_backoff(
+            attempt, self.retry_on, on_retry=on_retry, retry_if=is_transient
+        )
+
+    def open(self, spreadsheet):
+        return self.call(self.client.open, spreadsheet)
+
+    def modified_times(self):
+        """
+        Last-modified time of every spreadsheet visible to the client, from one Drive call.
+
+        Returns:
+            modified_times : dict
+                spreadsheet name -> modifiedTime
+        """
+        return {
+            spreadsheet["name"]: spreadsheet["modifiedTime"]
+            for spreadsheet in self.call(self.client.list_spreadsheet_files)
+        }
+
+    def worksheets(self, sh):
+        return self.call(sh.worksheets)
+
+    def batch_values(self, sh, titles, chunk_size=50):
+        """
+        Read whole worksheets with one values_batch_get request per chunk_size titles.
+
+        Returns:
+            values : dict
+                title -> cell grid (list of rows)
+        """
+        values = {}
+        for start in range(0, len(titles), chunk_size):
+            chunk = titles[start : start + chunk_size]
+            ranges = ["'{}'".format(title.replace("'", "''")) for title in chunk]
+            response = self.call(sh.values_batch_get, ranges)
+            for title, value_range in zip(chunk, response["valueRanges"]):
+                values[title] = value_range.get("values", [])
+        return values
+
+    def imap(self, fn, items):
+        """
+        Lazily apply fn to items on the thread pool, preserving order. At most
+        max_workers results are in flight or waiting, so memory does not grow with the
+        number of items.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def map(self, fn, items):
+        """
+        Apply fn to items on the thread pool, preserving order.
+        """
+        return list(self.imap(fn, items))
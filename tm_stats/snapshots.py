@@ -0,0 +1,59 @@
+"""
+Local store of the raw worksheet grids fetched by the ETL.
+
+Each spreadsheet is kept as one gzipped JSON file holding the title and cell grid of
+every game worksheet, so the cleaning in tm_stats.etl can be re-run without the
+Sheets API (python -m tm_stats.etl --replay).
+"""
+import gzip
+import json
+import os
+import uuid
+
+SNAPSHOT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "raw-sheets",
+)
+
+
+def snapshot_path(spreadsheet, root=SNAPSHOT_DIR):
+    return os.path.join(root, f"{spreadsheet}.json.gz")
+
+
+def has_snapshot(spreadsheet, root=SNAPSHOT_DIR):
+    return os.path.exists(snapshot_path(spreadsheet, root))
+
+
+def save_snapshot(spreadsheet, raw_sheets, root=SNAPSHOT_DIR):
+    """
+    Replace the snapshot of one spreadsheet.
+
+    Args:
+        spreadsheet : str
+        raw_sheets : list of dict
+            Every game worksheet of the spreadsheet, as returned by
+            tm_stats.etl.fetch_spreadsheet()
+        root : str
+    """
+    os.makedirs(root, exist_ok=True)
+    path = snapshot_path(spreadsheet, root)
+    # write then rename so an interrupted run never leaves a truncated snapshot
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"spreadsheet": spreadsheet, "worksheets": raw_sheets}, f)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(spreadsheet, root=SNAPSHOT_DIR):
+    """
+    Returns:
+        raw_sheets : list of dict
+            Same layout as tm_stats.etl.fetch_spreadsheet(), in worksheet order.
+    """
+    path = snapshot_path(spreadsheet, root)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No snapshot of {spreadsheet} at {path}; run the ETL without --replay first"
+        )
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["worksheets"]
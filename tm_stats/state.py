@@ -0,0 +1,83 @@
+"""
+Versioned snapshots of the game data and everything the dashboard derives from it.
+
+A snapshot is built completely (aggregates, warmed caches, indexes) before it is
+published, and publishing is a single reference swap, so a reload never blocks requests
+and a callback that took a snapshot keeps a consistent view of one dataset version until
+it returns, even if a newer snapshot is published meanwhile.
+"""
+import threading
+
+from tm_stats.cache import dataset_version
+
+
+class DatasetState:
+    """
+    Read-only bundle of one dataset version and its derived state.
+
+    Args:
+        version : int
+            Increases by one with every published snapshot.
+        data_version : str
+            Content hash of df, see tm_stats.cache.dataset_version().
+        df : pd.DataFrame
+        **derived
+            Anything precomputed from df, available as attributes.
+    """
+
+    def __init__(self, version, data_version, df, **derived):
+        self.version = version
+        self.data_version = data_version
+        self.df = df
+        self.__dict__.update(derived)
+
+    def __repr__(self):
+        return (
+            f"DatasetState(version={self.version}, data_version={self.data_version!r})"
+        )
+
+
+class StateStore:
+    """
+    Holds the current DatasetState and swaps in new ones.
+
+    Args:
+        build : callable
+            build(df, version, data_version, previous) -> DatasetState, previous being
+            the snapshot it replaces (None for the first), e.g. to update indexes instead
+            of rebuilding them. Called off the request path, on whichever thread
+            publishes.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._current = None
+        # one rebuild at a time; readers never take this lock
+        self._publish_lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._current
+
+    def publish(self, df):
+        """
+        Build a snapshot of df and make it current, unless df is the version already
+        being served.
+
+        Args:
+            df : pd.DataFrame
+        Returns:
+            published : bool
+        """
+        with self._publish_lock:
+            current = self._current
+            version = dataset_version(df)
+            if current is not None and current.data_version == version:
+                return False
+            self._current = self._build(
+                df,
+                version=1 if current is None else current.version + 1,
+                data_version=version,
+                previous=current,
+            )
+            return True
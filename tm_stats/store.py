@@ -0,0 +1,150 @@
+"""
+Append-only game store partitioned by month.
+
+Games live in games/<YYYY-MM>.csv under the repository root, keyed by their stable
+content-addressed game_id. New games are appended to their partition and every other
+partition is left untouched; a partition is only rewritten when one of its games was
+edited or deleted upstream (which gives the game a new id).
+"""
+import glob
+import os
+import uuid
+
+import pandas as pd
+
+STORE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "games",
+)
+
+
+def partition_key(dates):
+    """
+    Args:
+        dates : pd.Series
+    Returns:
+        keys : pd.Series
+            "YYYY-MM" per date
+    """
+    return pd.to_datetime(dates).dt.strftime("%Y-%m")
+
+
+def partition_path(key, root=STORE_DIR):
+    return os.path.join(root, f"{key}.csv")
+
+
+def game_id_partition(game_id):
+    """
+    Partition of a game from its id alone, e.g. "20220111-3f2a9c1b0d" -> "2022-01".
+    """
+    return f"{game_id[:4]}-{game_id[4:6]}"
+
+
+def _stored_game_ids(path):
+    if not os.path.exists(path):
+        return set()
+    return set(pd.read_csv(path, usecols=["game_id"], dtype=str)["game_id"])
+
+
+def _read_partition(path):
+    # as text, so rows that are kept are written back exactly as they were
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def update_game_store(new_df, removed_game_ids=(), root=STORE_DIR):
+    """
+    Append new games to their partitions and drop removed ones. Games that are already
+    stored are not added twice, so re-applying an update is harmless.
+
+    Args:
+        new_df : pd.DataFrame
+            Games to add, in the terraforming-mars-stats.csv layout
+        removed_game_ids : list of str
+            Games to drop, e.g. the previous version of an edited game
+        root : str
+    Returns:
+        touched : list of str
+            Partitions that were appended to or rewritten
+    """
+    os.makedirs(root, exist_ok=True)
+    # dates as text, like the rows already stored
+    new_df = new_df.assign(date=pd.to_datetime(new_df["date"]).dt.strftime("%Y-%m-%d"))
+    new_keys = (
+        partition_key(new_df["date"]) if new_df.shape[0] else pd.Series([], dtype=str)
+    )
+    removed_by_key = {}
+    for game_id in removed_game_ids:
+        removed_by_key.setdefault(game_id_partition(game_id), set()).add(game_id)
+
+    touched = []
+    for key in sorted(set(new_keys) | set(removed_by_key)):
+        path = partition_path(key, root)
+        partition_new_df = new_df[(new_keys == key).values]
+        stored_ids = _stored_game_ids(path)
+        removed_ids = removed_by_key.get(key, set()) & stored_ids
+
+        if removed_ids:
+            # a stored game was edited or removed: rewrite this partition only
+            partition_df = _read_partition(path)
+            partition_df = pd.concat(
+                [
+                    partition_df[
+                        ~partition_df["game_id"].isin(
+                            removed_ids | set(partition_new_df["game_id"])
+                        )
+                    ],
+                    partition_new_df,
+                ]
+            )
+            if partition_df.shape[0] == 0:
+                os.remove(path)
+            else:
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                partition_df.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, path)
+            touched.append(key)
+        else:
+            partition_new_df = partition_new_df[
+                ~partition_new_df["game_id"].isin(stored_ids)
+            ]
+            if partition_new_df.shape[0]:
+                partition_new_df.to_csv(
+                    path, mode="a", header=not os.path.exists(path), index=False
+                )
+                touched.append(key)
+    return touched
+
+
+def stored_partitions(root=STORE_DIR):
+    return sorted(
+        os.path.basename(path)[: -len(".csv")]
+        for path in glob.glob(os.path.join(root, "*.csv"))
+    )
+
+
+def clear_game_store(root=STORE_DIR):
+    for path in glob.glob(os.path.join(root, "*.csv")):
+        os.remove(path)
+
+
+def iter_game_store(root=STORE_DIR):
+    """
+    Yield the stored games one partition at a time, most recent first, as text.
+    """
+    for key in reversed(stored_partitions(root)):
+        yield _read_partition(partition_path(key, root)).sort_values(
+            by=["date", "game_id"], ascending=False, kind="mergesort"
+        )
+
+
+def write_game_store_csv(path, root=STORE_DIR):
+    """
+    Write every stored game to one CSV, a partition at a time.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    open(tmp_path, "w").close()
+    header = True
+    for partition_df in iter_game_store(root):
+        partition_df.to_csv(tmp_path, mode="a", header=header, index=False)
+        header = False
+    os.replace(tmp_path, path)
@@ -0,0 +1,187 @@
+"""
+Parameter sweep and backtest for the Elo scoring parameters.
+
+Each configuration is scored out of sample: every game is predicted from ratings built on
+earlier games only, and the pairwise placements of that game are scored by log-loss.
+
+Run from the repository root, e.g.:
+    python -m tm_stats.sweep --k 16 24 32 48 --d 200 400 800 --alpha 1.5 2 3
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tm_stats.elo import (
+    _elo_batch_pass,
+    _encode_games,
+    _game_pairs,
+    _score_array,
+    _subset_mask,
+    config_key,
+    DEFAULT_CONFIG,
+)
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "terraforming-mars-stats.csv",
+)
+RESULTS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "elo-sweep-results.csv",
+)
+
+
+def make_grid(k_values, d_values, alpha_values, score_funs=("linear", "exp"), subset="all"):
+    """
+    Args:
+        k_values, d_values, alpha_values : list
+        score_funs : list
+            Scoring functions to include. alpha only varies for 'exp'.
+        subset : str
+            'all', 'two-player' or 'non-two-player'
+    Returns:
+        configs : list of dict
+    """
+    configs = []
+    for score_fun, k, d in itertools.product(score_funs, k_values, d_values):
+        alphas = alpha_values if score_fun == "exp" else [DEFAULT_CONFIG["alpha"]]
+        for alpha in alphas:
+            configs.append(
+                {"score_fun": score_fun, "subset": subset, "k": k, "d": d, "alpha": alpha}
+            )
+    return configs
+
+
+def backtest(df, configs, entity_col="player", burn_in=0.25):
+    """
+    Prequential backtest of a batch of configurations in one pass over the games.
+
+    Args:
+        df : pd.DataFrame
+            All game data, i.e., terraforming-mars-stats.csv
+        configs : list of dict
+            Rating configurations, see tm_stats.elo.compute_historical_ratings()
+        entity_col : str
+            'player' or 'corporation'
+        burn_in : float
+            Fraction of the earliest games used only to build ratings, never scored.
+    Returns:
+        results_df : pd.DataFrame
+            One row per configuration with log_loss (mean pairwise log-loss on the next
+            game's placements), accuracy (share of decisive pairs ordered correctly) and
+            n_pairs.
+    """
+    configs = [{**DEFAULT_CONFIG, **config} for config in configs]
+    games = _encode_games(df, entity_col)
+    n_rows, n_games = len(games["codes"]), len(games["starts"])
+    game_sizes = np.diff(np.append(games["starts"], n_rows))
+
+    observed = np.array(
+        [
+            _score_array(
+                games["places"], games["sizes"], config["score_fun"], alpha=config["alpha"]
+            )
+            for config in configs
+        ]
+    )
+    include = np.array([_subset_mask(game_sizes, config["subset"]) for config in configs])
+    d = np.array([config["d"] for config in configs], dtype=float)
+    _, pre = _elo_batch_pass(
+        games["codes"],
+        games["starts"],
+        observed,
+        np.full((len(configs), len(games["entities"])), 1000.0),
+        include=include,
+        k=np.array([config["k"] for config in configs], dtype=float),
+        d=d,
+        return_pre=True,
+    )
+
+    i, j, game_of_pair = _game_pairs(games["starts"], n_rows)
+    keep = (games["codes"][i] != games["codes"][j]) & (
+        game_of_pair >= int(burn_in * n_games)
+    )
+    i, j = i[keep], j[keep]
+    outcome = np.sign(games["places"][j] - games["places"][i]) / 2 + 0.5  # 1 if i placed ahead
+    p = 1 / (1 + 10 ** ((pre[:, j] - pre[:, i]) / d[:, None]))
+    p = np.clip(p, 1e-12, 1 - 1e-12)
+
+    log_loss = -(outcome * np.log(p) + (1 - outcome) * np.log(1 - p))
+    # pairs in games a configuration does not rate (see subset) are NaN and left out
+    decisive = outcome != 0.5
+    correct = np.where(
+        np.isnan(p[:, decisive]), np.nan, (p[:, decisive] > 0.5) == (outcome[decisive] == 1)
+    )
+
+    results_df = pd.DataFrame(configs)
+    results_df["config"] = [config_key(config) for config in configs]
+    results_df["log_loss"] = np.nanmean(log_loss, axis=1)
+    results_df["accuracy"] = np.nanmean(correct, axis=1)
+    results_df["n_pairs"] = np.sum(~np.isnan(log_loss), axis=1)
+    return results_df
+
+
+_worker_df = None
+
+
+def _init_worker(df):
+    global _worker_df
+    _worker_df = df
+
+
+def _backtest_chunk(args):
+    configs, entity_col, burn_in = args
+    return backtest(_worker_df, configs, entity_col=entity_col, burn_in=burn_in)
+
+
+def run_sweep(df, configs, entity_col="player", burn_in=0.25, n_workers=None):
+    """
+    Backtest configs across a process pool. Each worker runs one batched pass over its
+    share of the grid.
+
+    Returns:
+        results_df : pd.DataFrame
+            Ranked by log_loss, best first
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    chunks = [configs[w::n_workers] for w in range(n_workers) if configs[w::n_workers]]
+    if len(chunks) == 1:
+        results = [backtest(df, chunks[0], entity_col=entity_col, burn_in=burn_in)]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=len(chunks), initializer=_init_worker, initargs=(df,)
+        ) as pool:
+            results = list(
+                pool.map(_backtest_chunk, [(chunk, entity_col, burn_in) for chunk in chunks])
+            )
+
+    results_df = pd.concat(results).sort_values(by="log_loss").reset_index(drop=True)
+    results_df.insert(0, "rank", np.arange(1, results_df.shape[0] + 1))
+    return results_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--k", nargs="+", type=float, default=[16, 24, 32, 48, 64])
+    parser.add_argument("--d", nargs="+", type=float, default=[200, 300, 400, 600, 800])
+    parser.add_argument("--alpha", nargs="+", type=float, default=[1.5, 2.0, 3.0])
+    parser.add_argument("--score-fun", nargs="+", default=["linear", "exp"])
+    parser.add_argument("--subset", default="all")
+    parser.add_argument("--entity", default="player")
+    parser.add_argument("--burn-in", type=float, default=0.25)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    configs = make_grid(args.k, args.d, args.alpha, args.score_fun, args.subset)
+    results_df = run_sweep(
+        df, configs, entity_col=args.entity, burn_in=args.burn_in, n_workers=args.workers
+    )
+    results_df.to_csv(args.output, index=False)
+    print(results_df.head(10).to_string(index=False))
@@ -0,0 +1,220 @@
+"""
+Server-side filtering, sorting and paging for Dash DataTables.
+
+With page_action, filter_action and sort_action set to "custom", the table sends its
+filter_query (e.g. '{player} contains Tony && {total_points} > 100'), sort_by and page,
+and the server returns only that page. Each filter clause becomes one vectorized mask,
+computed on the categories rather than every row for categorical columns.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+# longest first, so '>=' is not read as '>' followed by '=value'
+OPERATORS = [
+    (">=", ["ge"]),
+    ("<=", ["le"]),
+    ("!=", ["ne"]),
+    ("<", ["lt"]),
+    (">", ["gt"]),
+    ("=", ["eq"]),
+    ("contains", []),
+    ("datestartswith", []),
+]
+
+
+def _strip_quotes(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+        return value[1:-1].replace("\\" + value[0], value[0])
+    return value
+
+
+def split_filter_part(filter_part):
+    """
+    Args:
+        filter_part : str
+            One clause of a filter_query, e.g. '{total_points} >= 100'
+    Returns:
+        (column, operator, value) : tuple
+            operator is one of the symbols in OPERATORS, prefixed with i when the match
+            is case-insensitive (e.g. 'icontains'), or 'is blank'/'is not blank'.
+            (None, None, None) if the clause cannot be parsed.
+    """
+    filter_part = filter_part.strip()
+    if not filter_part.startswith("{") or "}" not in filter_part:
+        return None, None, None
+    column, rest = filter_part[1:].split("}", 1)
+    rest = rest.strip()
+
+    for operator in ["is not blank", "is blank"]:
+        if rest == operator:
+            return column, operator, None
+
+    # the table prefixes case-sensitive and -insensitive variants with s and i, and
+    # case-sensitive is the default
+    for operator, aliases in OPERATORS:
+        for name in [operator] + aliases:
+            for prefix in ["", "s", "i"]:
+                token = prefix + name
+                if rest.startswith(token) and (
+                    not name.isalpha() or rest[len(token) : len(token) + 1] in ["", " "]
+                ):
+                    value = _strip_quotes(rest[len(token) :])
+                    return column, prefix.replace("s", "") + operator, value
+    return None, None, None
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text_mask(series, predicate):
+    """
+    Apply predicate (vectorized over a string Series) to a column as text. Categorical
+    columns are evaluated once per category and mapped back through the codes.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = pd.Series(series.cat.categories.astype(str))
+        matches = np.append(predicate(categories).to_numpy(dtype=bool), False)
+        # code -1 (missing) picks the trailing False
+        return matches[series.cat.codes.to_numpy()]
+    text = series.astype(str).where(series.notna(), "")
+    return predicate(text).to_numpy(dtype=bool) & series.notna().to_numpy()
+
+
+def clause_mask(df, column, operator, value):
+    """
+    Returns:
+        mask : np.ndarray of bool
+            Rows of df matching one parsed filter clause. Unknown columns match
+            everything, so a half-typed filter does not empty the table.
+    """
+    if column not in df.columns:
+        return np.ones(df.shape[0], dtype=bool)
+    series = df[column]
+    if operator == "is blank":
+        return series.isna().to_numpy()
+    if operator == "is not blank":
+        return series.notna().to_numpy()
+
+    case_insensitive = operator.startswith("i")
+    operator = operator[1:] if case_insensitive else operator
+    if operator == "contains":
+        return _text_mask(
+            series,
+            lambda text: text.str.contains(
+                value, case=not case_insensitive, regex=False
+            ),
+        )
+    if operator == "datestartswith":
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime("%Y-%m-%d")
+        return _text_mask(series, lambda text: text.str.startswith(value))
+
+    if pd.api.types.is_numeric_dtype(series) and not isinstance(
+        series.dtype, pd.CategoricalDtype
+    ):
+        number = _as_number(value)
+        if number is None:
+            return np.zeros(df.shape[0], dtype=bool)
+        values, value = series.to_numpy(dtype=float), number
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        try:
+            values, value = series.to_numpy(), np.datetime64(pd.Timestamp(value))
+        except ValueError:
+            return np.zeros(df.shape[0], dtype=bool)
+    elif operator in ["=", "!="] and isinstance(series.dtype, pd.CategoricalDtype):
+        matches = _text_mask(
+            series,
+            lambda text: (
+                (text.str.lower() == value.lower())
+                if case_insensitive
+                else (text == value)
+            ),
+        )
+        return matches if operator == "=" else ~matches & series.notna().to_numpy()
+    else:
+        values = series.astype(str).to_numpy()
+        if case_insensitive:
+            values, value = np.char.lower(values.astype(str)), value.lower()
+
+    with np.errstate(invalid="ignore"):
+        if operator == "=":
+            return values == value
+        if operator == "!=":
+            return values != value
+        if operator == "<":
+            return values < value
+        if operator == "<=":
+            return values <= value
+        if operator == ">":
+            return values > value
+        return values >= value
+
+
+def filter_positions(df, filter_query):
+    """
+    Args:
+        df : pd.DataFrame
+        filter_query : str
+            Clauses joined by ' && ', as sent by the table.
+    Returns:
+        positions : np.ndarray of int
+            Row positions of df that match every clause.
+    """
+    mask = np.ones(df.shape[0], dtype=bool)
+    for filter_part in (filter_query or "").split(" && "):
+        column, operator, value = split_filter_part(filter_part)
+        if column is not None:
+            mask &= clause_mask(df, column, operator, value)
+    return np.flatnonzero(mask)
+
+
+def sort_positions(df, positions, sort_by):
+    """
+    Args:
+        df : pd.DataFrame
+        positions : np.ndarray of int
+            From filter_positions()
+        sort_by : list of dict
+            column_id and direction ('asc' or 'desc') per sort key, as sent by the table.
+    Returns:
+        positions : np.ndarray of int
+            Reordered; ties keep their order in df.
+    """
+    sort_by = [
+        sort_key for sort_key in (sort_by or []) if sort_key["column_id"] in df.columns
+    ]
+    if not sort_by:
+        return positions
+    sorted_df = (
+        df[[sort_key["column_id"] for sort_key in sort_by]]
+        .iloc[positions]
+        .reset_index(drop=True)
+    )
+    order = sorted_df.sort_values(
+        by=[sort_key["column_id"] for sort_key in sort_by],
+        ascending=[sort_key["direction"] == "asc" for sort_key in sort_by],
+        kind="mergesort",
+        na_position="last",
+    ).index.to_numpy()
+    return positions[order]
+
+
+def page(df, positions, page_current, page_size):
+    """
+    Returns:
+        page_df : pd.DataFrame
+            Rows of df for one page; the last page if page_current is past the end,
+            e.g. after a filter left fewer pages
+        page_count : int
+    """
+    page_size = page_size or 50
+    page_count = max(1, math.ceil(len(positions) / page_size))
+    start = min(page_current or 0, page_count - 1) * page_size
+    return df.iloc[positions[start : start + page_size]], page_count